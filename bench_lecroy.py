@@ -0,0 +1,222 @@
+#!/usr/bin/python
+import os
+import sys
+import tempfile
+import lecroy_archive
+import lecroy_trace
+from   lecroy import lecroy
+from   sim_lecroy import sim_lecroy
+
+# Round trip benchmark of the lecroy methods against the simulated scope.
+# Prints round trips, bytes moved and simulated wall time for every case, and exits with 1 when a case
+# needs more round trips than its threshold or the shadow state skips a write that changes a value.
+#   python bench_lecroy.py [latency_in_seconds] [bandwidth_in_bytes_per_second]
+
+# label, ver_scale, ver_offset, bw, coupling
+analog_channels = {
+    1: ('COOL_V1',      0.2,   -10,  '20MHz', 'DC1M'),
+    2: ('NASTY_V2',     0.5,  -4.9,  '20MHz', 'DC1M'),
+    3: ('FAVORITE_V3',    2,   -10,  '20MHz', 'DC1M'),
+    4: ('OLD_V4',         2,    -8,  '20MHz', 'DC1M'),
+    5: ('LITTLE_I1',      2,   3.0,  '20MHz', 'DC'),
+    6: ('BIGGER_I2',      2,   1.0,  '20MHz', 'DC'),
+    7: ('IMPORTANT_I3',   2,  -0.5,  '20MHz', 'DC'),
+    8: ('ARB_I4',       0.5,  -1.5,  '20MHz', 'DC')
+}
+
+digital_channels = {
+    0: 'cool_name_1',
+    1: 'even_better_name_2',
+    2: 'the_best_name_3',
+    3: 'worst_name_4'
+}
+
+measurement_channels = { 1:  ('C1', 'max'),
+                         2:  ('C1', 'level@x'),
+                         3:  ('C2', 'max'),
+                         4:  ('C2', 'level@x'),
+                         5:  ('C3', 'max'),
+                         6:  ('C3', 'level@x'),
+                         7:  ('C5', 'max'),
+                         8:  ('C6', 'max'),
+                         9:  ('C7', 'max'),
+                         10: ('C8', 'max'),
+                         11: ('C8', 'level@x'),
+                         12: ('C8', 'level@x') }
+
+output_dir = tempfile.mkdtemp(prefix='bench_lecroy_')
+
+
+def prepare_setup(scope):
+    scope.channel_setup(analog_channels, digital_channels)
+    scope.measurement_setup(measurement_channels)
+
+
+def batched_channel_setup(scope):
+    with scope.batch():
+        scope.channel_setup(analog_channels, digital_channels)
+
+
+def repeated_channel_setup(scope):
+    # second run of the same setup with the shadow state enabled
+    scope.channel_setup(analog_channels, digital_channels)
+
+
+def prepare_shadow(scope):
+    scope.enable_shadow()
+    scope.channel_setup(analog_channels, digital_channels)
+
+
+def run_full_setup(scope):
+    prepare_setup(scope)
+    scope.horizontal_scale(2e-4)
+    scope.trigger_setup('C4', 0.25, -6e-4, 'Positive', 'Auto')
+    scope.channel_colors()
+
+
+def prepare_shadow_full_setup(scope):
+    # only the volatile TriggerMode is sent again
+    scope.enable_shadow()
+    run_full_setup(scope)
+
+
+full_setup = {'channel_setup':     {'analog_ch_dict': analog_channels, 'digital_ch_dict': digital_channels},
+              'horizontal_scale':  (2e-4,),
+              'measurement_setup': (measurement_channels,),
+              'trigger_setup':     ('C4', 0.25, -6e-4, 'Positive', 'Auto'),
+              'channel_colors':    {}}
+
+
+def apply_full_setup(scope):
+    scope.apply_setup(full_setup, os.path.join(output_dir, 'setups'))
+
+
+def sequence_capture(scope):
+    scope.get_sequence_to_file('C1', os.path.join(output_dir, 'sequence'), chunk_points=25000)
+
+
+def archive_capture(scope):
+    lecroy_archive.save_capture(scope, os.path.join(output_dir, 'capture.lca'), ['C1', 'C2'])
+
+
+def traced_channel_setup(scope):
+    scope.tracer = lecroy_trace.tracer()
+    scope.channel_setup(analog_channels, digital_channels)
+
+
+def prepare_deep_memory(scope):
+    prepare_setup(scope)
+    scope.scope.points = 1000000  # positioning downloads a sparsed record
+
+
+def prepare_sequence(scope):
+    scope.set_sequence_mode(num_segments=10)
+
+
+# name, function run on a fresh simulated scope, optional preparation (not counted), round trip threshold
+cases = [
+    ('channel_setup',             lambda s: s.channel_setup(analog_channels, digital_channels), None,             94),
+    ('channel_setup batched',     batched_channel_setup,                                        None,              2),
+    ('channel_setup repeated',    repeated_channel_setup,                                       prepare_shadow,    0),
+    ('channel_setup traced',      traced_channel_setup,                                         None,             94),
+    ('channel_colors',            lambda s: s.channel_colors(),                                 None,             17),
+    ('set_date_and_time',         lambda s: s.set_date_and_time(),                              None,              7),
+    ('measurement_setup',         lambda s: s.measurement_setup(measurement_channels),          None,             36),
+    ('trigger_setup',             lambda s: s.trigger_setup('C4', 0.25, -6e-4, 'Positive', 'Auto'), None,          7),
+    ('trigger_setup_dict',        lambda s: s.trigger_setup_dict(),                             None,              7),
+    ('horizontal_scale',          lambda s: s.horizontal_scale(2e-4),                           None,              2),
+    ('full setup',                run_full_setup,                                               None,            156),
+    ('full setup repeated',       run_full_setup,                                               prepare_shadow_full_setup, 1),
+    ('apply_setup first time',    apply_full_setup,                                             None,              8),
+    ('apply_setup cached',        apply_full_setup,                                             apply_full_setup,  2),
+    ('get_analog_channel_setup',  lambda s: s.get_analog_channel_setup(),                       prepare_setup,     2),
+    ('get_digital_channel_setup', lambda s: s.get_digital_channel_setup(),                      prepare_setup,     1),
+    ('get_measurement_setup',     lambda s: s.get_measurement_setup(),                          prepare_setup,     1),
+    ('get_trigger_setup',         lambda s: s.get_trigger_setup(),                              None,              1),
+    ('get_horizontal_scale',      lambda s: s.get_horizontal_scale(),                           None,              1),
+    ('get_all_measurements',      lambda s: s.get_all_measurements(),                           prepare_setup,     3),
+    ('getValueOnChannel x72',     lambda s: [s.getValueOnChannel('P{0}'.format(p), stat) for p in range(1, 13)
+                                             for stat in ('value', 'mean', 'max', 'min', 'sdev', 'num')],
+                                                                                                prepare_setup,    72),
+    ('update_signal_offset',      lambda s: s.update_signal_offset(analog_channels, 'LITTLE_I1', 0), prepare_setup,  4),
+    ('update_signal_offset deep', lambda s: s.update_signal_offset(analog_channels, 'LITTLE_I1', 0),
+                                                                                                prepare_deep_memory, 4),
+    ('auto_position x8',          lambda s: s.auto_position(analog_channels),                   prepare_setup,    47),
+    ('get_screen_image',          lambda s: s.get_screen_image(os.path.join(output_dir, 'screen')), None,          2),
+    ('get_waveform',              lambda s: s.get_waveform('C1'),                               None,              2),
+    ('get_waveforms x8',          lambda s: s.get_waveforms(['C{0}'.format(c) for c in range(1, 9)]), None,       16),
+    ('get_digital_waveform',      lambda s: s.get_digital_waveform(),                           None,              2),
+    ('get_sequence_to_file',      sequence_capture,                                             prepare_sequence, 13),
+    ('save_capture x2',           archive_capture,                                              None,              8),
+    ('setGrid',                   lambda s: s.setGrid('Quad'),                                  None,              1),
+    ('setHorizontal_delay',       lambda s: s.setHorizontal_delay(-1e-4),                       None,              1),
+    ('set_intensity',             lambda s: s.set_intensity(50),                                None,              1),
+    ('reset_scope',               lambda s: s.reset_scope(),                                    None,              1),
+    ('measurement_levelatx',      lambda s: s.measurement_levelatx(11, -1e-6),                  None,              1),
+    ('trigger_force',             lambda s: s.trigger_force(),                                  None,              1),
+    ('set_memory_size',           lambda s: s.set_memory_size('2.5E+6'),                        None,              1),
+    ('wait_for_idle',             lambda s: s.wait_for_idle(),                                  None,              1),
+    ('arm_single + wait',         lambda s: (s.arm_single(), s.wait_for_trigger()),             None,              3),
+]
+
+
+# the shadow state must never skip a write that changes the value: name, commands, property, value expected
+shadow_checks = [
+    ('VerOffset -1 then 1',     ['VBS app.Acquisition.C1.VerOffset=-1', 'VBS app.Acquisition.C1.VerOffset=1'],
+                                'app.Acquisition.C1.VerOffset', '1'),
+    ('Edge.Level -1 then 1',    ['VBS app.Acquisition.Trigger.Edge.Level=-1', 'VBS app.Acquisition.Trigger.Edge.Level=1'],
+                                'app.Acquisition.Trigger.Edge.Level', '1'),
+    ('label "1" then "-1"',     ['VBS app.Acquisition.C1.LabelsText="1"', 'VBS app.Acquisition.C1.LabelsText="-1"'],
+                                'app.Acquisition.C1.LabelsText', '-1'),
+    ('View True then 0',        ['VBS app.Acquisition.C1.View=True', 'VBS app.Acquisition.C1.View=0'],
+                                'app.Acquisition.C1.View', '0'),
+    ('TDIV then HorScale',      ['TDIV 1.000000e-03', 'VBS app.Acquisition.Horizontal.HorScale=0.002',
+                                 'TDIV 1.000000e-03'],
+                                'app.Acquisition.Horizontal.HorScale', '1.000000e-03'),
+]
+
+
+def run_shadow_check(commands, prop):
+    instrument = sim_lecroy(latency=0.0)
+    scope = lecroy(pyvisa_instr=instrument)
+    scope.enable_shadow()
+    for command in commands:
+        scope.write(command)
+    return instrument.prop(prop)
+
+
+def run_case(function, prepare=None, latency=0.002, bandwidth=20e6):
+    instrument = sim_lecroy(latency=latency, bandwidth=bandwidth)
+    scope = lecroy(pyvisa_instr=instrument)
+    if prepare is not None:
+        prepare(scope)
+    instrument.reset_stats()
+    function(scope)
+    return instrument.stats
+
+
+def main(latency=0.002, bandwidth=20e6):
+    failed = []
+    print('{0:28s} {1:>6s} {2:>6s} {3:>10s} {4:>10s} {5:>10s}'.format(
+        'case', 'trips', 'limit', 'written', 'read', 'time [ms]'))
+    for name, function, prepare, threshold in cases:
+        stats = run_case(function, prepare, latency, bandwidth)
+        flag = ''
+        if stats['round_trips'] > threshold:
+            failed.append(name)
+            flag = '  REGRESSION'
+        print('{0:28s} {1:6d} {2:6d} {3:10d} {4:10d} {5:10.1f}{6}'.format(
+            name, stats['round_trips'], threshold, stats['bytes_written'], stats['bytes_read'],
+            stats['time'] * 1000, flag))
+    for name, commands, prop, expected in shadow_checks:
+        value = run_shadow_check(commands, prop)
+        if value != expected:
+            failed.append(name)
+            print('shadow check {0}: scope has {1}, expected {2}  REGRESSION'.format(name, value, expected))
+    if failed:
+        print('regressions: {0}'.format(', '.join(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[float(arg) for arg in sys.argv[1:3]]))
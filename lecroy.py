@@ -1,31 +1,409 @@
 #!/usr/bin/python
 import datetime
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import lecroy_waveform  # needs numpy, only the waveform methods use it
+    import lecroy_measure
+except ImportError:
+    lecroy_waveform = None
+    lecroy_measure  = None
 
 class lecroy():
 
     # Constructor
-    def __init__(self, pyvisa_instr, num_channels=8, debug=False):
-        self.scope        = pyvisa_instr  # this is the pyvisa instrument
-        self.num_channels = num_channels
-        self.debug        = debug
+    def __init__(self, pyvisa_instr, num_channels=8, debug=False, max_batch_length=2000):
+        self.scope            = pyvisa_instr  # this is the pyvisa instrument
+        self.num_channels     = num_channels
+        self.debug            = debug
+        self.max_batch_length = max_batch_length  # longest multi-statement VBS write sent while batching
+        self.batch_queue      = None              # list of queued VBS statements, None when not batching
+        self.batch_stats      = {'statements': 0, 'writes': 0, 'saved': 0}
+        self.shadow           = None              # property -> (value, time written or read), None when disabled
+        self.shadow_max_age   = None              # seconds before a shadow value is no longer trusted, None is forever
+        self.shadow_stats     = {'sent': 0, 'skipped': 0}
+        self.tracer           = None              # e.g. lecroy_trace.tracer(), records every transaction when set
+        self.lock             = threading.RLock() # one transaction (or write and read pair) at a time
+        self.unconverged      = []                # channels auto_position could not position
 
     unit_ms = 10 ** (-3)
     unit_us = 10 ** (-6)
 
-    def get_screen_image(self, path_with_filename='', backcolor='WHITE'):
-        # valid backcolor can be either 'WHITE' or 'BLACK'
+    def write(self, command):
+        # every command to the scope goes through here, so batching works for all of the setters
+        with self.lock:
+            if self.shadow is not None and self.shadow_skip(command):
+                return
+            if self.batch_queue is not None:
+                statement = self.vbs_statement(command)
+                if statement is not None:
+                    self.batch_queue.append(statement)
+                    return
+                self.flush()  # non-VBS command, keep the order on the scope
+            self.send(command)
+
+    def send(self, command):
+        try:
+            if self.tracer is None:
+                self.scope.write(command)
+            else:
+                self.traced('write', command, self.scope.write, command)
+        except Exception:
+            self.invalidate_shadow()  # the shadow state may hold values the scope never got
+            raise
+
+    def query(self, command):
+        with self.lock:
+            self.flush()
+            if self.tracer is None:
+                return self.scope.query(command)
+            return self.traced('query', command, self.scope.query, command)
+
+    def read_raw(self, size=None):
+        # size is the chunk size of each read, the pyvisa default when None
+        args = () if size is None else (size,)
+        with self.lock:
+            if self.tracer is None:
+                return self.scope.read_raw(*args)
+            return self.traced('read', '', self.scope.read_raw, *args)
+
+    def write_raw(self, message):
+        with self.lock:
+            self.flush()
+            if self.tracer is None:
+                self.scope.write_raw(message)
+            else:
+                self.traced('write', message[:32].decode('latin-1'), self.scope.write_raw, message,
+                            bytes_out=len(message))
+
+    def query_raw(self, command, size=None):
+        # writes a command and reads the binary answer, no other thread can get in between
+        with self.lock:
+            self.write(command)
+            return self.read_raw(size)
+
+    # transport methods, skipped when looking for the lecroy method that caused a transaction
+    transport_methods = ('write', 'send', 'query', 'read_raw', 'write_raw', 'query_raw', 'flush', 'traced', 'query_vbs_list',
+                         'batch', '__exit__', 'strip_vbs_header')
+
+    def traced(self, direction, command, function, *args, bytes_out=None):
+        start = time.perf_counter()
+        result = function(*args)
+        latency = time.perf_counter() - start
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_code.co_name in self.transport_methods:
+            frame = frame.f_back
+        # pyvisa writes return the number of bytes written, only text or data read back counts as bytes in
+        bytes_in = len(result) if isinstance(result, (str, bytes, bytearray)) else 0
+        self.tracer.record(direction, command, len(command) if bytes_out is None else bytes_out, bytes_in,
+                           start, latency, frame.f_code.co_name if frame is not None else '')
+        return result
+
+    def vbs_statement(self, command):
+        # returns the bare VBS statement of a 'VBS ...' write, None if it can not be combined with others
+        if not command.startswith('VBS '):
+            return None
+        statement = command[4:].strip()
+        if len(statement) > 1 and statement[0] == "'" and statement[-1] == "'":
+            statement = statement[1:-1]
+        if "'" in statement:  # a quote would end the multi-statement string early
+            return None
+        return statement
+
+    def flush(self):
+        """
+        Sends all queued VBS statements, joined with ':' into as few writes as max_batch_length allows.
+        :return: number of writes sent
+        """
+        if not self.batch_queue:
+            return 0
+        queue, self.batch_queue = self.batch_queue, []
+        writes = []
+        for statement in queue:
+            if writes and len(writes[-1]) + len(statement) + 3 <= self.max_batch_length:
+                writes[-1] += ' : ' + statement
+            else:
+                writes.append(statement)
+        for vbs in writes:
+            self.send("VBS '{0}'".format(vbs))
+        self.batch_stats['statements'] += len(queue)
+        self.batch_stats['writes']     += len(writes)
+        self.batch_stats['saved']       = self.batch_stats['statements'] - self.batch_stats['writes']
+        return len(writes)
+
+    @contextmanager
+    def batch(self):
+        """
+        Queues the VBS writes of any setter and sends them as multi-statement VBS writes.
+        Queries and non-VBS commands flush the queue first, so the scope sees the same order.
+        :return: dictionary with the number of statements, writes sent and round trips saved
+
+        Example:
+            with scope.batch() as stats:
+                scope.channel_setup(analog_channels, digital_channels)
+                scope.channel_colors()
+            print(stats['saved'])
+        """
+        if self.batch_queue is not None:  # nested batch, the outer one sends everything
+            yield self.batch_stats
+            return
+        self.batch_queue = []
+        self.batch_stats = {'statements': 0, 'writes': 0, 'saved': 0}
+        try:
+            yield self.batch_stats
+        finally:
+            try:
+                self.flush()
+            finally:
+                self.batch_queue = None
+        if self.debug:
+            print("batched {0} statements into {1} writes, saved {2} round trips".format(
+                self.batch_stats['statements'], self.batch_stats['writes'], self.batch_stats['saved']))
+
+    # non-VBS commands that do not change the setup, everything else clears the shadow state
+    shadow_safe_commands = ('CHDR', 'HCSU', 'SCDP', 'FORCE_TRIGGER', 'FRTR', 'ARM', 'WAIT', '*CLS', 'CFMT', 'CORD', 'WFSU',
+                            'STO')
+
+    # non-VBS commands that set one property, so the shadow state can follow them
+    shadow_property_commands = {'TDIV': 'app.acquisition.horizontal.horscale'}
+
+    # properties the scope changes by itself, e.g. 'Single' becomes 'Stopped' after the trigger
+    shadow_volatile = ('app.acquisition.triggermode',)
+
+    vbs_assignment = re.compile(r'^(app(?:\.\w+)+)\s*=\s*("[^"]*"|[^":]+)$')
+    vbs_call       = re.compile(r'^app(?:\.\w+)+(?:\(.*\))?$')
+
+    def enable_shadow(self, max_age=None):
+        """
+        Keeps a shadow copy of every property written to (or read back from) the scope, and skips
+        writes that would set a property to the value it already has.
+        :param max_age: seconds a shadow value is trusted for, None trusts it until invalidated
+        :return: None
+        """
+        if self.shadow is None:
+            self.shadow = {}
+        self.shadow_max_age = max_age
+        self.shadow_stats   = {'sent': 0, 'skipped': 0}
+
+    def disable_shadow(self):
+        self.shadow = None
+
+    def invalidate_shadow(self, prefix=''):
+        # call after changing settings from the front panel, prefix e.g. 'app.Acquisition.C1' only forgets that part
+        if self.shadow is None:
+            return
+        prefix = prefix.lower()
+        for key in [key for key in self.shadow if key.startswith(prefix)]:
+            del self.shadow[key]
+
+    def shadow_value(self, value):
+        # normalize a VBS value so a written "True" compares equal to a read back -1
+        value = value.strip()
+        if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+            return value[1:-1]  # quoted strings (e.g. labels) are compared as text
+        if value.lower() == 'true':  # booleans compare as the -1/0 the scope reads back, numbers stay numbers
+            return -1.0
+        if value.lower() == 'false':
+            return 0.0
+        try:
+            return float(value)
+        except ValueError:
+            return value
 
-        self.scope.write("CHDR OFF;HCSU BCKG,%s;HCSU DEV,PNG;HCSU PORT,GPIB;SCDP" % backcolor)
-        raw_data = self.scope.read_raw()
+    def shadow_record(self, prop, value):
+        self.shadow[prop.lower()] = (self.shadow_value(value), time.monotonic())
+
+    def shadow_skip(self, command):
+        # returns True when the command only sets properties to the values the scope already has
+        statement = command[4:].strip().strip("'") if command.startswith('VBS ') else None
+        if statement is None:
+            header = command.split()[0].upper() if command.strip() else ''
+            if header in self.shadow_property_commands and ';' not in command:
+                return self.shadow_skip_command(self.shadow_property_commands[header], command.split(None, 1)[1])
+            if not all(part.strip().upper().startswith(self.shadow_safe_commands) or '?' in part
+                       for part in command.split(';')):
+                self.invalidate_shadow()
+            return False
+        match = self.vbs_assignment.match(statement)
+        if match is None:
+            if self.vbs_call.match(statement) is None:  # multi-statement or script, unknown effect
+                self.invalidate_shadow()
+            return False
+        prop, value = match.group(1).lower(), self.shadow_value(match.group(2))
+        if prop in self.shadow_volatile:
+            return False
+        return self.shadow_skip_property(prop, value)
+
+    def shadow_skip_command(self, prop, value):
+        # e.g. TDIV also changes the sample rate and the other horizontal settings, those are forgotten
+        value = self.shadow_value(value)
+        if self.shadow_skip_property(prop, value):
+            return True
+        self.invalidate_shadow(prop.rsplit('.', 1)[0] + '.')
+        self.shadow[prop] = (value, time.monotonic())
+        return False
+
+    def shadow_skip_property(self, prop, value):
+        known = self.shadow.get(prop)
+        if known is not None and (self.shadow_max_age is None or time.monotonic() - known[1] <= self.shadow_max_age):
+            same = known[0] == value
+            if isinstance(value, float) and isinstance(known[0], float):
+                same = math.isclose(known[0], value, rel_tol=1e-6, abs_tol=1e-15)
+            if same:
+                self.shadow_stats['skipped'] += 1
+                return True
+        self.shadow[prop] = (value, time.monotonic())
+        self.shadow_stats['sent'] += 1
+        return False
+
+    def block_data(self, raw):
+        """
+        Finds the data of an IEEE 488.2 definite length block ('#9000001234<data>').
+        :return: (offset of the data in raw, length of the data)
+        """
+        start = raw.find(b'#')
+        if start < 0:
+            raise ValueError("no data block in the {0} bytes received".format(len(raw)))
+        digits = int(raw[start + 1:start + 2])
+        length = int(raw[start + 2:start + 2 + digits])
+        return start + 2 + digits, length
+
+    vbs_separator = '\x1e'  # ASCII record separator, will not show up in labels or values
+
+    def strip_vbs_header(self, msg):
+        # sometimes scope answers with "VBS *" and sometimes not
+        msg = msg[4:] if msg.startswith('VBS') else msg
+        return msg.strip()
+
+    def query_vbs_list(self, expressions, max_length=0):
+        """
+        Reads a list of VBS expressions, all in one 'VBS? return = a & sep & b & ...' query.
+        The expressions are split over more than one query only if they do not fit in max_length.
+        :param expressions: e.g. ['app.Acquisition.C1.View', 'app.Acquisition.C1.VerScale']
+        :param max_length: longest query to send, 0 uses max_batch_length and None never splits
+        :return: list of stripped strings, in the same order as expressions
+        """
+        if max_length == 0:
+            max_length = self.max_batch_length
+        if max_length is not None:
+            max_length -= len('VBS? return = ')  # the limit is for the whole query
+        joiner = ' & Chr({0}) & '.format(ord(self.vbs_separator))
+        groups = []
+        for expression in expressions:
+            if groups and (max_length is None or len(groups[-1]) + len(joiner) + len(expression) <= max_length):
+                groups[-1] += joiner + expression
+            else:
+                groups.append(expression)
+        values = []
+        for group in groups:
+            msg = self.strip_vbs_header(self.query('VBS? return = {0}'.format(group)))
+            values.extend([value.strip() for value in msg.split(self.vbs_separator)])
+        if len(values) != len(expressions):
+            raise ValueError("expected {0} values from the scope, received {1}".format(len(expressions), len(values)))
+        if self.shadow is not None:  # readbacks seed the shadow state
+            for expression, value in zip(expressions, values):
+                if self.vbs_call.match(expression) and '(' not in expression:
+                    self.shadow_record(expression, value)
+        return values
+
+    def vbs_bool(self, value):
+        # a VBS boolean comes back as -1/0 on its own and as True/False when concatenated into a string
+        return value.strip().lower() in ('-1', 'true')
+
+    def vbs_float(self, value):
+        # 'No Data' and other text become nan
+        try:
+            return float(value)
+        except ValueError:
+            return float('nan')
+
+    screen_image_count = 0  # makes the default file names unique, even within one microsecond
+
+    def unique_filename(self, extension='.png'):
+        # default file name of screen images and sequence captures, timestamp plus a counter
+        lecroy.screen_image_count += 1
+        return "lecroy_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f") + \
+               "_{0:04d}{1}".format(lecroy.screen_image_count, extension)
+
+    def screen_image_filename(self, path_with_filename=''):
         if (path_with_filename == ''):
-            path_with_filename = "lecroy_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".png"
+            path_with_filename = self.unique_filename('.png')
         elif '.png' not in path_with_filename:  # append png if not given
             path_with_filename += '.png'
+        return path_with_filename
+
+    def read_screen_image(self, backcolor='WHITE', chunk_size=None):
+        # returns the PNG bytes of the screen, valid backcolor can be either 'WHITE' or 'BLACK'
+        return self.query_raw("CHDR OFF;HCSU BCKG,%s;HCSU DEV,PNG;HCSU PORT,GPIB;SCDP" % backcolor, chunk_size)
+
+    def get_screen_image(self, path_with_filename='', backcolor='WHITE'):
+        # valid backcolor can be either 'WHITE' or 'BLACK'
+
+        raw_data = self.read_screen_image(backcolor)
+        path_with_filename = self.screen_image_filename(path_with_filename)
         file_stream = open(path_with_filename, 'wb')
         file_stream.write(raw_data)
         file_stream.close()
         return len(raw_data)
 
+    def get_waveform(self, channel='C1', sparsing=0):
+        """
+        Downloads the waveform of a channel as binary 16 bit words.
+        :param channel: 'C1'..'C8', 'F1'.., 'M1'..
+        :param sparsing: only every sparsing-th point is sent (WFSU SP), 0 or 1 sends all of them
+        :return: lecroy_waveform.waveform, codes is a view on the received bytes (no copy),
+                 volts and times are scaled when first used
+        """
+        if lecroy_waveform is None:
+            raise ImportError("get_waveform needs numpy")
+        raw = self.query_raw('CHDR OFF;CFMT DEF9,WORD,BIN;CORD LO;WFSU SP,{0},NP,0,FP,0,SN,0;{1}:WF? ALL'.format(
+            sparsing, channel))
+        return lecroy_waveform.parse_waveform(raw, channel)
+
+    def get_waveforms(self, channels=('C1',), sparsing=0):
+        """
+        Downloads several channels into one shared (channel, point) array of codes, (channel, segment, point)
+        in sequence mode.
+        Each channel is copied into its row as soon as it is received, so only one raw transfer is held at a time.
+        :param channels: e.g. ['C1', 'C2', 'C4']
+        :param sparsing: see get_waveform
+        :return: dictionary of channel -> lecroy_waveform.waveform, codes are rows of the shared array
+        """
+        waveforms = {}
+        shared = None
+        for row, channel in enumerate(channels):
+            wave = self.get_waveform(channel, sparsing)
+            if shared is None:
+                shared = lecroy_waveform.np.empty((len(channels),) + wave.codes.shape, dtype=wave.codes.dtype)
+            elif wave.codes.shape != shared.shape[1:] or wave.codes.dtype != shared.dtype:
+                raise ValueError("{0} has {1} points, {2} has {3}".format(
+                    channels[0], shared.shape[1:], channel, wave.codes.shape))
+            shared[row] = wave.codes
+            waveforms[channel] = lecroy_waveform.waveform(wave.desc, shared[row], wave.trigger_times, channel)
+        return waveforms
+
+    def get_digital_waveform(self, group='Digital1', lanes=16, labels=None):
+        """
+        Downloads all lanes of a logic analyzer group in one binary transfer (one 16 bit word per sample,
+        bit n is lane n) and keeps them bit-packed.
+        :param group: 'Digital1'
+        :param labels: lane -> name, e.g. get_digital_channel_setup()
+        :return: lecroy_waveform.digital_waveform
+        """
+        if lecroy_waveform is None:
+            raise ImportError("get_digital_waveform needs numpy")
+        raw = self.query_raw('CHDR OFF;CFMT DEF9,WORD,BIN;CORD LO;{0}:WF? ALL'.format(group))
+        wave = lecroy_waveform.parse_waveform(raw, group)
+        packed = lecroy_waveform.pack_lanes(wave.codes.reshape(-1), lanes)
+        return lecroy_waveform.digital_waveform(wave.desc, packed, wave.codes.size, labels)
+
     def trigger_setup(self, channel, trig_level, trig_horizontal, trig_slope, trig_mode):
         """
         Adjusts the parameters of the trigger setup.
@@ -38,33 +416,39 @@ class lecroy():
         :return:
         """
 
-        self.scope.write('VBS app.Acquisition.Trigger.Type="Edge"')
-        self.scope.write('VBS app.Acquisition.Trigger.Source="{0}"'.format(channel))
-        self.scope.write('VBS app.Acquisition.Trigger.Edge.Level={0}'.format(trig_level))
-        self.scope.write('VBS app.Acquisition.Horizontal.HorOffset={0}'.format(trig_horizontal))
-        self.scope.write('VBS app.Acquisition.Trigger.Edge.Slope="{0}"'.format(trig_slope))
-        self.scope.write('VBS app.Acquisition.TriggerMode="{0}"'.format(trig_mode))
+        self.write('VBS app.Acquisition.Trigger.Type="Edge"')
+        self.write('VBS app.Acquisition.Trigger.Source="{0}"'.format(channel))
+        self.write('VBS app.Acquisition.Trigger.Edge.Level={0}'.format(trig_level))
+        self.write('VBS app.Acquisition.Horizontal.HorOffset={0}'.format(trig_horizontal))
+        self.write('VBS app.Acquisition.Trigger.Edge.Slope="{0}"'.format(trig_slope))
+        self.write('VBS app.Acquisition.TriggerMode="{0}"'.format(trig_mode))
         if (channel.startswith('C')):
-            self.scope.write('VBS app.Acquisition.Trigger.Coupling="AC"'.format(channel))
+            self.write('VBS app.Acquisition.Trigger.Coupling="AC"'.format(channel))
     
     # { 0 : channel, 1 : trig_level, 2 : horiz_offset, 3 : trig_slope, 4 : trig_mode, 5 : trig_type }
     def trigger_setup_dict(self, trigger_dict={0 : 'C1', 1 : 0.25, 2: 0.0, 3 : 'Either', 4 : 'Auto', 5 : 'Edge'}):
-        self.scope.write('VBS app.Acquisition.Trigger.Source="{0}"'.format(trigger_dict[0]))
-        self.scope.write('VBS app.Acquisition.Trigger.Edge.Level={0}'.format(trigger_dict[1]))
-        self.scope.write('VBS app.Acquisition.Horizontal.HorOffset={0}'.format(trigger_dict[2]))
-        self.scope.write('VBS app.Acquisition.Trigger.Edge.Slope="{0}"'.format(trigger_dict[3]))
-        self.scope.write('VBS app.Acquisition.TriggerMode="{0}"'.format(trigger_dict[4]))
-        self.scope.write('VBS app.Acquisition.Trigger.Type={0}'.format(trigger_dict[5]))
+        self.write('VBS app.Acquisition.Trigger.Source="{0}"'.format(trigger_dict[0]))
+        self.write('VBS app.Acquisition.Trigger.Edge.Level={0}'.format(trigger_dict[1]))
+        self.write('VBS app.Acquisition.Horizontal.HorOffset={0}'.format(trigger_dict[2]))
+        self.write('VBS app.Acquisition.Trigger.Edge.Slope="{0}"'.format(trigger_dict[3]))
+        self.write('VBS app.Acquisition.TriggerMode="{0}"'.format(trigger_dict[4]))
+        self.write('VBS app.Acquisition.Trigger.Type={0}'.format(trigger_dict[5]))
         if (trigger_dict[0].startswith('C')):
-            self.scope.write('VBS app.Acquisition.Trigger.Coupling="AC"'.format(trigger_dict[0]))
+            self.write('VBS app.Acquisition.Trigger.Coupling="AC"'.format(trigger_dict[0]))
     
     def get_trigger_setup(self):
-        channel    = self.scope.query('VBS? return = app.Acquisition.Trigger.Source').strip()
-        trig_level = float(self.scope.query('VBS? return = app.Acquisition.Trigger.Edge.Level').strip())
-        trig_horiz = float(self.scope.query('VBS? return = app.Acquisition.Horizontal.HorOffset').strip())
-        trig_slope = self.scope.query('VBS? return = app.Acquisition.Trigger.Edge.Slope').strip()
-        trig_mode  = self.scope.query('VBS? return = app.Acquisition.TriggerMode').strip()
-        trig_type  = self.scope.query('VBS? return = app.Acquisition.Trigger.Type').strip()
+        values = self.query_vbs_list(['app.Acquisition.Trigger.Source',
+                                      'app.Acquisition.Trigger.Edge.Level',
+                                      'app.Acquisition.Horizontal.HorOffset',
+                                      'app.Acquisition.Trigger.Edge.Slope',
+                                      'app.Acquisition.TriggerMode',
+                                      'app.Acquisition.Trigger.Type'])
+        channel    = values[0]
+        trig_level = float(values[1])
+        trig_horiz = float(values[2])
+        trig_slope = values[3]
+        trig_mode  = values[4]
+        trig_type  = values[5]
         return {0 : channel, 1 : trig_level, 2 : trig_horiz, 3: trig_slope, 4 : trig_mode, 5 : trig_type}
 
     def channel_setup(self, analog_ch_dict={}, digital_ch_dict={}, math_ch_dict={}):
@@ -119,86 +503,130 @@ class lecroy():
             'ver_center': 5,
         }
 
-        # --- Turn off all analog channels ---
+        # --- Turn off all analog channels that are not listed ---
         for sweep_channels in range(1, 9):
-            self.scope.write('VBS app.Acquisition.C{0}.View=False'.format(sweep_channels))
+            if sweep_channels not in analog_ch_dict:  # listed ones are turned on below
+                self.write('VBS app.Acquisition.C{0}.View=False'.format(sweep_channels))
 
         # --- Turn on all listed analog channels and set up ---
         for k, v in analog_ch_dict.items():
-            self.scope.write('VBS app.Acquisition.C{0}.View=True'.format(k))
-            self.scope.write('VBS app.Acquisition.C{0}.ViewLabels=True'.format(k))
-            self.scope.write('VBS app.Acquisition.C{0}.LabelsText="{1}"'.format(k, v[ch_desc['label']]))
-            self.scope.write('VBS app.Acquisition.C{0}.VerScale={1}'.format(k, v[ch_desc['ver_scale']]))
-            self.scope.write('VBS app.Acquisition.C{0}.VerOffset={1}'.format(k, v[ch_desc['ver_offset']]))
-            self.scope.write('VBS app.Acquisition.C{0}.BandwidthLimit="{1}"'.format(k, v[ch_desc['bw']]))
-            self.scope.write('VBS app.Acquisition.C{0}.Coupling="{1}"'.format(k, v[ch_desc['coupling']]))
+            self.write('VBS app.Acquisition.C{0}.View=True'.format(k))
+            self.write('VBS app.Acquisition.C{0}.ViewLabels=True'.format(k))
+            self.write('VBS app.Acquisition.C{0}.LabelsText="{1}"'.format(k, v[ch_desc['label']]))
+            self.write('VBS app.Acquisition.C{0}.VerScale={1}'.format(k, v[ch_desc['ver_scale']]))
+            self.write('VBS app.Acquisition.C{0}.VerOffset={1}'.format(k, v[ch_desc['ver_offset']]))
+            self.write('VBS app.Acquisition.C{0}.BandwidthLimit="{1}"'.format(k, v[ch_desc['bw']]))
+            self.write('VBS app.Acquisition.C{0}.Coupling="{1}"'.format(k, v[ch_desc['coupling']]))
 
-        self.scope.write('VBS app.Display.TraceIntensity=100')
+        self.write('VBS app.Display.TraceIntensity=100')
 
         # ***** Digital Channel Section ******************************************************************
 
-        # --- Turn off all digital channels ---
+        # --- Turn off all digital channels that are not listed ---
         for sweep_channels in range(0, 16):
-            self.scope.write('VBS app.LogicAnalyzer.Digital1.Digital{0}.Value=false'.format(sweep_channels))
+            if sweep_channels not in digital_ch_dict:  # listed ones are turned on below
+                self.write('VBS app.LogicAnalyzer.Digital1.Digital{0}.Value=false'.format(sweep_channels))
         # --- Turn on all listed digital channels and set up ---
         for k, v in digital_ch_dict.items():
-            self.scope.write('VBS app.LogicAnalyzer.Digital1.Digital{0}.Value=true'.format(k))
-            self.scope.write('VBS app.LogicAnalyzer.Digital1.CustomBitName{0}.Value="{1}"'.format(k, v))
-        self.scope.write('VBS app.LogicAnalyzer.Digital1.View=true')
-        self.scope.write('VBS app.LogicAnalyzer.Digital1.VerPosition=4.00')
-        self.scope.write('VBS app.LogicAnalyzer.Digital1.GroupHeight=1.00')
-        self.scope.write('VBS app.LogicAnalyzer.Digital1.Labels="CUSTOM"')
+            self.write('VBS app.LogicAnalyzer.Digital1.Digital{0}.Value=true'.format(k))
+            self.write('VBS app.LogicAnalyzer.Digital1.CustomBitName{0}.Value="{1}"'.format(k, v))
+        self.write('VBS app.LogicAnalyzer.Digital1.View=true')
+        self.write('VBS app.LogicAnalyzer.Digital1.VerPosition=4.00')
+        self.write('VBS app.LogicAnalyzer.Digital1.GroupHeight=1.00')
+        self.write('VBS app.LogicAnalyzer.Digital1.Labels="CUSTOM"')
         # ***** End Digital Channel Section **************************************************************
 
         # ***** Math Channel Section ******************************************************************
-        # --- Turn off all math channels ---
+        # --- Turn off all math channels that are not listed ---
         for sweep_channels in range(0, 13):
-            self.scope.write('VBS app.Math.F{0}.View=false'.format(sweep_channels))
+            if sweep_channels not in math_ch_dict:  # listed ones are turned on below
+                self.write('VBS app.Math.F{0}.View=false'.format(sweep_channels))
         # --- Turn on listed math channels ---
         for k, v in math_ch_dict.items():
-            self.scope.write('VBS app.Math.F{0}.View=True'.format(k))
-            self.scope.write('VBS app.Math.F{0}.ViewLabels=True'.format(k))
-            self.scope.write('VBS app.Math.F{0}.LabelsText="{1}"'.format(k, v[math_ch_desc['label']]))
-            self.scope.write('VBS app.Math.F{0}.Operator1="{1}"'.format(k, v[math_ch_desc['operator']]))
-            self.scope.write('VBS app.Math.F{0}.Source1="{1}"'.format(k, v[math_ch_desc['source1']]))
-            self.scope.write('VBS app.Math.F{0}.Source2="{1}"'.format(k, v[math_ch_desc['source2']]))
-            self.scope.write('VBS app.Math.F{0}.Zoom.VerCenter={1}'.format(k, v[math_ch_desc['ver_center']]))
-            time.sleep(2)
-            self.scope.write('VBS app.Math.F{0}.Zoom.VerScale={1}'.format(k, v[math_ch_desc['ver_scale']]))
+            self.write('VBS app.Math.F{0}.View=True'.format(k))
+            self.write('VBS app.Math.F{0}.ViewLabels=True'.format(k))
+            self.write('VBS app.Math.F{0}.LabelsText="{1}"'.format(k, v[math_ch_desc['label']]))
+            self.write('VBS app.Math.F{0}.Operator1="{1}"'.format(k, v[math_ch_desc['operator']]))
+            self.write('VBS app.Math.F{0}.Source1="{1}"'.format(k, v[math_ch_desc['source1']]))
+            self.write('VBS app.Math.F{0}.Source2="{1}"'.format(k, v[math_ch_desc['source2']]))
+            self.write('VBS app.Math.F{0}.Zoom.VerCenter={1}'.format(k, v[math_ch_desc['ver_center']]))
+            self.wait_for_idle()
+            self.write('VBS app.Math.F{0}.Zoom.VerScale={1}'.format(k, v[math_ch_desc['ver_scale']]))
         # ***** End math Channel Section **************************************************************
 
     def get_analog_channel_setup(self):
         analog_channels = {}
+        properties = ['View', 'ViewLabels', 'labelsText', 'VerScale', 'VerOffset', 'BandwidthLimit', 'Coupling']
+        values = self.query_vbs_list(['app.Acquisition.C{0}.{1}'.format(sweep_channels, p)
+                                      for sweep_channels in range(1, 9) for p in properties])
         for sweep_channels in range(1, 9):
-            if (int(self.scope.query('VBS? return = app.Acquisition.C{0}.View'.format(sweep_channels))) == -1):
-                label = ''
-                if (int(self.scope.query('VBS? return = app.Acquisition.C{0}.ViewLabels'.format(sweep_channels))) == -1):
-                    label = str(self.scope.query('VBS? return = app.Acquisition.C{0}.labelsText'.format(sweep_channels)).strip())
-                ver_scale     = float(self.scope.query('VBS? return = app.Acquisition.C{0}.VerScale'.format(sweep_channels)))
-                ver_offset    = float(self.scope.query('VBS? return = app.Acquisition.C{0}.VerOffset'.format(sweep_channels)))
-                bandwidth_lim = str(self.scope.query('VBS? return = app.Acquisition.C{0}.BandwidthLimit'.format(sweep_channels)).strip())
-                coupling      = str(self.scope.query('VBS? return = app.Acquisition.C{0}.Coupling'.format(sweep_channels)).strip())
-                analog_channels[sweep_channels] = (label, ver_scale, ver_offset, bandwidth_lim, coupling)
+            view, view_labels, label, ver_scale, ver_offset, bandwidth_lim, coupling = \
+                values[(sweep_channels - 1) * len(properties):sweep_channels * len(properties)]
+            if self.vbs_bool(view):
+                label = label if self.vbs_bool(view_labels) else ''
+                analog_channels[sweep_channels] = (label, float(ver_scale), float(ver_offset), bandwidth_lim, coupling)
         return analog_channels
 
     def get_digital_channel_setup(self):
         digital_channels = {}
+        values = self.query_vbs_list(['app.LogicAnalyzer.Digital1.{0}{1}.Value'.format(p, sweep_channels)
+                                      for sweep_channels in range(0, 16) for p in ('Digital', 'CustomBitName')])
         for sweep_channels in range(0, 16):
-            if (int(self.scope.query('VBS? return = app.LogicAnalyzer.Digital1.Digital{0}.Value'.format(sweep_channels))) == -1):
-                label = str(self.scope.query('VBS? return = app.LogicAnalyzer.Digital1.CustomBitName{0}.Value'.format(sweep_channels)).strip())
-                digital_channels[sweep_channels] = label
+            if self.vbs_bool(values[2 * sweep_channels]):
+                digital_channels[sweep_channels] = values[2 * sweep_channels + 1]
         return digital_channels
         
+    def arm_single(self):
+        # clears the new acquisition flag and arms the scope for one acquisition
+        self.query('INR?')
+        self.write('ARM')
+
+    def wait_for_trigger(self, timeout=10.0):
+        """
+        Polls the internal state register until a new acquisition is done, starting with short polls and
+        backing off up to 50ms, so it returns as soon as the scope triggers.
+        :param timeout: seconds
+        :return: True when a new acquisition is done, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            inr = int(self.strip_vbs_header(self.query('INR?')).split()[-1].split(',')[-1])
+            if inr & 0x1:  # bit 0: new signal acquired
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def wait_for_idle(self, timeout=10.0):
+        """
+        Waits until the scope has finished processing all of the commands sent so far.
+        The scope waits (app.WaitUntilIdle) in short steps that grow up to 1s, so it returns as soon as it is idle.
+        :param timeout: seconds
+        :return: True when the scope is idle, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        step = 0.01
+        while True:
+            remaining = deadline - time.monotonic()
+            step = max(min(step, remaining), 0.0)
+            if self.vbs_bool(self.strip_vbs_header(self.query('VBS? return = app.WaitUntilIdle({0})'.format(step)))):
+                return True
+            if remaining <= step:
+                return False
+            step = min(step * 2, 1.0)
+
     def trigger_force(self):
         # Force a trigger event (when the scope is in the ready state)
-        self.scope.write('FORCE_TRIGGER')
+        self.write('FORCE_TRIGGER')
 
     def horizontal_scale(self, scale=1E-3):
-        self.scope.write('TDIV %e' % scale)
-        self.scope.write('app.Acquisition.Horizontal.Maximize = "MODE"')
+        self.write('TDIV %e' % scale)
+        self.write('VBS app.Acquisition.Horizontal.Maximize="MODE"')
         
     def get_horizontal_scale(self):
-        horizontal_scale = float(self.scope.query('VBS? return = app.Acquisition.Horizontal.HorScale').strip())
+        horizontal_scale = float(self.query('VBS? return = app.Acquisition.Horizontal.HorScale').strip())
         return horizontal_scale
 
     def set_date_and_time(self, year=None, month=None, day=None, hour=None, minute=None, second=None):
@@ -215,13 +643,13 @@ class lecroy():
             minute =  datetime.datetime.now().minute
         if (second is None):
             second =  datetime.datetime.now().second
-        self.scope.write("VBS app.Utility.DateTimeSetup.Year = {0}".format(year))
-        self.scope.write("VBS app.Utility.DateTimeSetup.Month = {0}".format(month))
-        self.scope.write("VBS app.Utility.DateTimeSetup.Day = {0}".format(day))
-        self.scope.write("VBS app.Utility.DateTimeSetup.Hour = {0}".format(hour))
-        self.scope.write("VBS app.Utility.DateTimeSetup.Minute = {0}".format(minute))
-        self.scope.write("VBS app.Utility.DateTimeSetup.Second = {0}".format(second))
-        self.scope.write("VBS app.Utility.DateTimeSetup.Validate")
+        self.write("VBS app.Utility.DateTimeSetup.Year = {0}".format(year))
+        self.write("VBS app.Utility.DateTimeSetup.Month = {0}".format(month))
+        self.write("VBS app.Utility.DateTimeSetup.Day = {0}".format(day))
+        self.write("VBS app.Utility.DateTimeSetup.Hour = {0}".format(hour))
+        self.write("VBS app.Utility.DateTimeSetup.Minute = {0}".format(minute))
+        self.write("VBS app.Utility.DateTimeSetup.Second = {0}".format(second))
+        self.write("VBS app.Utility.DateTimeSetup.Validate")
 
     def measurement_setup(self, meas_dict):
         """
@@ -249,27 +677,29 @@ class lecroy():
             'measurement': 1
         }
 
-        # --- Turn off all measurements ---
+        # --- Turn off all measurements that are not listed ---
         for sweep_measurements in range(1, 9):
-            self.scope.write('VBS app.Measure.P{0}.View=False'.format(sweep_measurements))
+            if sweep_measurements not in meas_dict:  # listed ones are turned on below
+                self.write('VBS app.Measure.P{0}.View=False'.format(sweep_measurements))
 
         # --- Turn on all listed measurements and set up ---
         for k, v in meas_dict.items():
-            self.scope.write('VBS app.Measure.P{0}.View=True'.format(k))
-            self.scope.write('VBS app.Measure.P{0}.Source1="{1}"'.format(k, v[meas_desc['source']]))
-            self.scope.write('VBS app.Measure.P{0}.ParamEngine="{1}"'.format(k, v[meas_desc['measurement']]))
+            self.write('VBS app.Measure.P{0}.View=True'.format(k))
+            self.write('VBS app.Measure.P{0}.Source1="{1}"'.format(k, v[meas_desc['source']]))
+            self.write('VBS app.Measure.P{0}.ParamEngine="{1}"'.format(k, v[meas_desc['measurement']]))
 
     def get_measurement_setup(self):
         measure_channels = {}
+        values = self.query_vbs_list(['app.Measure.P{0}.{1}'.format(sweep_channels, p)
+                                      for sweep_channels in range(1, 13) for p in ('View', 'Source1', 'ParamEngine')])
         for sweep_channels in range(1, 13):
-            if (int(self.scope.query('VBS? return = app.Measure.P{0}.View'.format(sweep_channels))) == -1):
-                source      = str(self.scope.query('VBS? return = app.Measure.P{0}.Source1'.format(sweep_channels)).strip())
-                measurement = str(self.scope.query('VBS? return = app.Measure.P{0}.ParamEngine'.format(sweep_channels)).strip())
+            view, source, measurement = values[(sweep_channels - 1) * 3:sweep_channels * 3]
+            if self.vbs_bool(view):
                 measure_channels[sweep_channels] = (source, measurement)
         return measure_channels
             
     def measurement_levelatx(self, meas_channel='1', position=0.0):
-        self.scope.write('VBS app.Measure.P{0}.operator.horvalue={1}'.format(meas_channel,position))
+        self.write('VBS app.Measure.P{0}.operator.horvalue={1}'.format(meas_channel,position))
 
     def getValueOnChannel(self, assigned_channel, stat_type='value'):
         """
@@ -300,7 +730,7 @@ class lecroy():
                 'num'   : ('app.Measure.{0}.Statistics("num").Result.Value'.format(assigned_channel)),
                 'sdev'  : ('app.Measure.{0}.Statistics("sdev").Result.Value'.format(assigned_channel)),
                 'status': ('app.Measure.{0}.Statistics("last").Result.StatusDescription'.format(assigned_channel))}
-        msg = self.scope.query("VBS? return = {0}".format(meas[stat_type]))
+        msg = self.query("VBS? return = {0}".format(meas[stat_type]))
         # I had to add this because sometimes scope answers with "VBS *" and sometimes not
         msg = msg[4:] if "VBS" in msg else msg
 
@@ -309,22 +739,58 @@ class lecroy():
         else:
             return float(msg)
 
+    measurement_stats = ('value', 'mean', 'max', 'min', 'sdev', 'num')
+
+    def get_all_measurements(self, slots=range(1, 13)):
+        """
+        Reads the value, statistics and status of every visible measurement in as few VBS queries as
+        max_batch_length allows (3 for all 12 slots with the default of 2000 characters).
+        :param slots: measurement numbers to look at, 1 is 'P1'
+        :return: dictionary keyed by measurement number (like get_measurement_setup) of dictionaries with
+                 'value', 'mean', 'max', 'min', 'sdev', 'num' as floats ('No Data' is nan),
+                 'status' as given by the scope and 'valid' False when the value is not a number
+
+        Example:
+            results = scope.get_all_measurements()
+            overshoot_C1 = results[1]['value'] - results[2]['value']
+        """
+        expressions = []
+        for slot in slots:
+            expressions.append('app.Measure.P{0}.View'.format(slot))
+            expressions.append('app.Measure.P{0}.Out.Result.Value'.format(slot))
+            for stat in self.measurement_stats[1:]:
+                expressions.append('app.Measure.P{0}.Statistics("{1}").Result.Value'.format(slot, stat))
+            expressions.append('app.Measure.P{0}.Statistics("last").Result.StatusDescription'.format(slot))
+        values = self.query_vbs_list(expressions)
+        width = len(self.measurement_stats) + 2
+        results = {}
+        for position, slot in enumerate(slots):
+            row = values[position * width:(position + 1) * width]
+            if not self.vbs_bool(row[0]):
+                continue
+            result = dict(zip(self.measurement_stats, [self.vbs_float(value) for value in row[1:-1]]))
+            result['status'] = row[-1]
+            result['valid']  = not math.isnan(result['value'])
+            results[slot] = result
+        return results
+
     def setGrid(self, gridmode='Single'):
         """
         Sets the number grids on the display.
         :param gridmode: possible values: 'Single', 'Dual', 'Quad', 'Octal', 'Tandem', 'Quattro', 'Auto'
         :return: None
         """
-        self.scope.write('VBS app.Display.GridMode="{}"'.format(gridmode))
+        self.write('VBS app.Display.GridMode="{}"'.format(gridmode))
 
     def setHorizontal_delay(self, delay=0.0):
-        self.scope.write('VBS app.Acquisition.Horizontal.HorOffset={0}'.format(delay))
+        self.write('VBS app.Acquisition.Horizontal.HorOffset={0}'.format(delay))
 
     def reset_scope(self):
-        self.scope.write('*RST')
+        self.write('*RST')
+        self.invalidate_shadow()
 
     def set_intensity(self, percent=100):
-        self.scope.write('VBS app.Display.PersistenceSaturation= {0}'.format(percent))
+        self.write('VBS app.Display.PersistenceSaturation= {0}'.format(percent))
 
     def get_channel_from_tuple_signal_name(self, analog_channels, signal_name=''):
         for channel in analog_channels.keys():
@@ -334,51 +800,254 @@ class lecroy():
     # the scope already needs to be in auto sampling, in order to get measure data
     # div_offset of zero is the center, valid values are between 3 and -4 (float values ok)
     def update_signal_offset(self, analog_channels, signal_name='', div_offset=0, meas_type='median'):
+        if lecroy_measure is not None and meas_type.lower() in lecroy_measure.parameters:
+            self.auto_position(analog_channels, {signal_name: div_offset}, meas_type)
+            return
+        # without numpy, or for a meas_type only the scope has, measure with the P1 measurement
         # save P1 config before we over-write them
-        save_p1_view   = self.scope.query('VBS? return = app.Measure.P1.View')
+        save_p1_view   = self.query('VBS? return = app.Measure.P1.View')
         save_p1_view = save_p1_view[4:] if "VBS" in save_p1_view else save_p1_view
-        save_p1_source = self.scope.query('VBS? return = app.Measure.P1.Source1')
+        save_p1_source = self.query('VBS? return = app.Measure.P1.Source1')
         save_p1_source = save_p1_source[4:] if "VBS" in save_p1_source else save_p1_source
-        save_p1_param  = self.scope.query('VBS? return = app.Measure.P1.ParamEngine')
+        save_p1_param  = self.query('VBS? return = app.Measure.P1.ParamEngine')
         save_p1_param = save_p1_param[4:] if "VBS" in save_p1_param else save_p1_param
         signal_channel = self.get_channel_from_tuple_signal_name(analog_channels,signal_name)
         ver_scale = analog_channels[signal_channel][1]
-        # ver_scale = self.scope.query('VBS? return = app.Acquisition.{0}.VerScale'.format(signal_channel))
+        # ver_scale = self.query('VBS? return = app.Acquisition.{0}.VerScale'.format(signal_channel))
         # measure the signal on the P1 measure config
-        self.scope.write('VBS app.Measure.P1.View=True')
-        self.scope.write('VBS app.Measure.P1.Source1="C{0}"'.format(signal_channel))
-        self.scope.write('VBS app.Measure.P1.ParamEngine="{0}"'.format(meas_type))
+        self.write('VBS app.Measure.P1.View=True')
+        self.write('VBS app.Measure.P1.Source1="C{0}"'.format(signal_channel))
+        self.write('VBS app.Measure.P1.ParamEngine="{0}"'.format(meas_type))
         value = self.getValueOnChannel('P1', stat_type='value')
         offset = (div_offset * ver_scale) - value
-        self.scope.write('VBS app.Acquisition.C{0}.VerOffset={1}'.format(signal_channel, offset))
+        self.write('VBS app.Acquisition.C{0}.VerOffset={1}'.format(signal_channel, offset))
         # restore P1 saved config
         if (save_p1_view.replace('\n','') == '0'):
-            self.scope.write('VBS app.Measure.P1.View=False')
+            self.write('VBS app.Measure.P1.View=False')
         else:
-            self.scope.write('VBS app.Measure.P1.View=True')
-        self.scope.write('VBS app.Measure.P1.Source1="{0}"'.format(save_p1_source.replace('\n','')))
-        self.scope.write('VBS app.Measure.P1.ParamEngine="{0}"'.format(save_p1_param.replace('\n','')))
+            self.write('VBS app.Measure.P1.View=True')
+        self.write('VBS app.Measure.P1.Source1="{0}"'.format(save_p1_source.replace('\n','')))
+        self.write('VBS app.Measure.P1.ParamEngine="{0}"'.format(save_p1_param.replace('\n','')))
+
+    def nice_scale(self, volts_per_div):
+        # next 1, 2, 5 step at or above volts_per_div
+        decade = 10 ** math.floor(math.log10(volts_per_div))
+        for step in (1, 2, 5, 10):
+            if step * decade >= volts_per_div * (1 - 1e-9):
+                return step * decade
+
+    def auto_position(self, analog_channels, targets=None, meas_type='median', auto_scale=False, scale_divs=6,
+                      max_iterations=8, timeout=2.0, position=0.0, max_points=10000):
+        """
+        Positions the signals of several channels at once: one waveform download of all of them, the offsets
+        (and vertical scales) of every channel computed together, and one batched write. Channels that were
+        clipped are downloaded and positioned again, up to max_iterations times.
+        The scope needs to be triggering (e.g. 'Auto' mode). No measurement is touched.
+        :param analog_channels: dictionary as given to channel_setup, used to find channels by signal name
+        :param targets: dictionary of channel number or signal name -> division (0 is the center, 3 to -4),
+                        default is every channel of analog_channels on the center
+        :param meas_type: level that is put on the division, one of lecroy_measure.parameters, e.g. 'median'
+        :param auto_scale: also set VerScale, so the peak to peak of the signal takes scale_divs divisions
+        :param position: time (relative to the trigger) used by 'level@x'
+        :param max_points: points per channel downloaded for positioning, deep records are sparsed (WFSU SP)
+                           down to this, 0 downloads the full record
+        :return: dictionary of channel number -> (ver_scale, ver_offset), channels that are still clipped after
+                 max_iterations, or were not measured again because the trigger timed out, are in self.unconverged
+        """
+        if lecroy_measure is None:
+            raise ImportError("auto_position needs numpy")
+        meas_type = meas_type.lower()
+        np = lecroy_waveform.np
+        if targets is None:
+            targets = {channel: 0 for channel in analog_channels}
+        divisions = {}
+        for channel, div_offset in targets.items():
+            if not isinstance(channel, int):
+                channel = self.get_channel_from_tuple_signal_name(analog_channels, channel)
+            divisions[channel] = div_offset
+        channels = list(divisions)
+        values = self.query_vbs_list(['app.Acquisition.C{0}.{1}'.format(channel, p)
+                                      for channel in channels for p in ('VerScale', 'VerOffset')] +
+                                     ['app.Acquisition.Horizontal.NumPoints'])
+        setup = {channel: (float(values[2 * i]), float(values[2 * i + 1])) for i, channel in enumerate(channels)}
+        num_points = self.vbs_float(values[-1])
+        sparsing = int(math.ceil(num_points / max_points)) if max_points and num_points > max_points else 0
+        pending = channels
+        for iteration in range(max_iterations):
+            waves = self.get_waveforms(['C{0}'.format(channel) for channel in pending], sparsing)
+            codes = waves['C{0}'.format(pending[0])].codes.base.reshape(len(pending), -1)  # shared (channel, point)
+            descs = [waves['C{0}'.format(channel)].desc for channel in pending]
+            gain   = np.array([desc['vertical_gain'] for desc in descs])[:, None]
+            offset = np.array([desc['vertical_offset'] for desc in descs])[:, None]
+            top    = np.array([desc['max_value'] for desc in descs])[:, None]
+            bottom = np.array([desc['min_value'] for desc in descs])[:, None]
+            volts  = codes * gain - offset
+            clipped = ((codes >= top) | (codes <= bottom)).any(axis=1)
+            results = lecroy_measure.measure(volts, [meas_type, 'pkpk'], descs[0]['horiz_interval'],
+                                             descs[0]['horiz_offset'], position)
+            # a level on the edge of the screen means the signal is further out, move a full screen at least
+            top, bottom = (top * gain - offset)[:, 0], (bottom * gain - offset)[:, 0]
+            level = results[meas_type]
+            level = np.where(level >= top, level + (top - bottom) / 2, level)
+            level = np.where(level <= bottom, level - (top - bottom) / 2, level)
+            scales = np.array([setup[channel][0] for channel in pending])
+            if auto_scale:
+                scales = np.array([self.nice_scale(pkpk / scale_divs) if pkpk > 0 and not clip else scale * 2 if clip
+                                   else scale for pkpk, clip, scale in zip(results['pkpk'], clipped, scales)])
+            div_offsets = np.array([divisions[channel] for channel in pending])
+            new_offsets = div_offsets * scales - level
+            with self.batch():
+                for channel, scale, ver_offset in zip(pending, scales, new_offsets):
+                    if auto_scale:
+                        self.write('VBS app.Acquisition.C{0}.VerScale={1}'.format(channel, scale))
+                    self.write('VBS app.Acquisition.C{0}.VerOffset={1}'.format(channel, ver_offset))
+                    setup[channel] = (float(scale), float(ver_offset))
+            pending = [channel for channel, clip in zip(pending, clipped) if clip]
+            if not pending:
+                break
+            self.query('INR?')  # wait for an acquisition with the new settings
+            if not self.wait_for_trigger(timeout):
+                break  # measuring the old acquisition again would move the offsets twice
+        self.unconverged = pending
+        if self.debug and pending:
+            print("auto_position did not converge on channels {0}".format(pending))
+        return setup
+
+    def save_setup(self):
+        """
+        Reads the complete panel setup of the scope in one binary transfer.
+        :return: bytes, give them to recall_setup to restore the setup
+        """
+        raw = self.query_raw('CHDR OFF;PNL?')
+        offset, length = self.block_data(raw)
+        return raw[offset:offset + length]
+
+    def recall_setup(self, panel):
+        # restores a panel setup from save_setup in one transfer
+        self.write_raw(b'PNL #9%09d' % len(panel) + panel + b'\n')
+        self.invalidate_shadow()
+        self.wait_for_idle()
+
+    def setup_key(self, setup):
+        # hash of the setup dictionaries, the same settings always give the same key
+        # the setters are called in the order given, so their order is part of the key
+        def canonical(value):
+            if isinstance(value, dict):
+                return {repr(k): canonical(v) for k, v in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [canonical(v) for v in value]
+            return repr(value)
+        ordered = [[method, canonical(args)] for method, args in setup.items()]
+        return hashlib.sha256(json.dumps(ordered, sort_keys=True).encode()).hexdigest()
+
+    def apply_setup(self, setup, cache_dir='lecroy_setups'):
+        """
+        Applies a setup made of lecroy setter calls. The first time, the setters are called and the resulting
+        panel setup is saved in cache_dir, keyed by a hash of setup. After that it is one recall_setup upload.
+        Use one cache_dir per scope model, panel setups are not portable between models.
+        :param setup: dictionary of lecroy method name -> tuple of arguments or dictionary of keyword arguments,
+                      called in the order given
+        :param cache_dir: directory of the cached panel setups
+        :return: True when the setup came from the cache, False when it was built with the setters
+
+        Example:
+            scope.apply_setup({'channel_setup':      {'analog_ch_dict': analog_channels,
+                                                      'digital_ch_dict': digital_channels},
+                               'horizontal_scale':   (0.2 * scope.unit_ms,),
+                               'measurement_setup':  (measurement_channels,),
+                               'trigger_setup_dict': (trigger,),
+                               'channel_colors':     {}})
+        """
+        path_with_filename = os.path.join(cache_dir, self.setup_key(setup) + '.lss')
+        if os.path.exists(path_with_filename):
+            with open(path_with_filename, 'rb') as file_stream:
+                self.recall_setup(file_stream.read())
+            return True
+        with self.batch():
+            for method, args in setup.items():
+                if isinstance(args, dict):
+                    getattr(self, method)(**args)
+                else:
+                    getattr(self, method)(*args)
+        self.wait_for_idle()
+        panel = self.save_setup()
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path_with_filename + '.tmp', 'wb') as file_stream:
+            file_stream.write(panel)
+        os.replace(path_with_filename + '.tmp', path_with_filename)
+        return False
 
     def set_memory_size(self, memory_size='2.5E+6'):
-        self.scope.write('memory_size {0}'.format(memory_size))
-        # self.scope.query('memory_size?')
-        #self.scope.write('VBS app.Acquisition.Horizontal.MaxSamples={}'.format(memory_size))
+        self.write('memory_size {0}'.format(memory_size))
+        # self.query('memory_size?')
+        #self.write('VBS app.Acquisition.Horizontal.MaxSamples={}'.format(memory_size))
+
+    def set_sequence_mode(self, num_segments=1000, enable=True):
+        # sequence mode splits the memory into num_segments, one per trigger
+        if enable:
+            self.write('VBS app.Acquisition.Horizontal.SampleMode="Sequence"')
+            self.write('VBS app.Acquisition.Horizontal.NumSegments={0}'.format(num_segments))
+        else:
+            self.write('VBS app.Acquisition.Horizontal.SampleMode="RealTime"')
+
+    def get_sequence_to_file(self, channel='C1', path_with_filename='', chunk_points=1000000):
+        """
+        Streams a sequence mode capture of one channel into a .npy file, chunk_points at a time,
+        so host memory stays bounded by the chunk size and not by the record length.
+        :param channel: 'C1'..'C8'
+        :param path_with_filename: .npy file to create, default is a timestamped name
+        :param chunk_points: number of points per transfer
+        :return: lecroy_waveform.waveform, codes is a (segment, point) np.memmap of the file and
+                 trigger_times holds the (time, offset) of each segment
+        """
+        if lecroy_waveform is None:
+            raise ImportError("get_sequence_to_file needs numpy")
+        np = lecroy_waveform.np
+        if (path_with_filename == ''):
+            path_with_filename = self.unique_filename('.npy')
+        elif not path_with_filename.endswith('.npy'):
+            path_with_filename += '.npy'
+        desc = lecroy_waveform.parse_wavedesc(
+            self.query_raw('CHDR OFF;CFMT DEF9,WORD,BIN;CORD LO;WFSU SP,0,NP,0,FP,0,SN,0;{0}:WF? DESC'.format(channel)))
+        segments = max(desc['subarray_count'], 1)
+        total_points = desc['wave_array_1'] // desc['dtype'].itemsize
+        trigger_times = None
+        if desc['trigtime_array'] > 0:
+            raw = self.query_raw('{0}:WF? TIME'.format(channel))
+            offset, length = self.block_data(raw)
+            trigger_times = np.frombuffer(raw, dtype=lecroy_waveform.trigger_time_dtype.newbyteorder(desc['byte_order']),
+                                          count=length // 16, offset=offset).copy()
+        codes = np.lib.format.open_memmap(path_with_filename, mode='w+', dtype=desc['dtype'].newbyteorder('='),
+                                          shape=(segments, total_points // segments))
+        flat = codes.reshape(-1)
+        with self.lock:  # WFSU stays changed until the last chunk, keep other threads out
+            try:
+                for first_point in range(0, flat.size, chunk_points):
+                    raw = self.query_raw('WFSU SP,0,NP,{0},FP,{1},SN,0;{2}:WF? DAT1'.format(chunk_points, first_point, channel))
+                    offset, length = self.block_data(raw)
+                    chunk = np.frombuffer(raw, dtype=desc['dtype'], count=length // desc['dtype'].itemsize, offset=offset)
+                    flat[first_point:first_point + len(chunk)] = chunk
+                    del raw, chunk
+            finally:
+                self.write('WFSU SP,0,NP,0,FP,0,SN,0')
+                codes.flush()
+        return lecroy_waveform.waveform(desc, codes, trigger_times, channel)
 
     def channel_colors(self, c1_color=0x00FF00, c2_color=0x00FFFF, c3_color=0x0000FF, c4_color=0xFF0000, c5_color=0xFF0080, c6_color=0x00a5FF, c7_color=0x8000FF, c8_color=0xCC0000 ):
-        self.scope.write('VBS app.Hardcopy.PrintLogo=False')
-        self.scope.write('VBS app.Display.C1Color="{0}"'.format(c1_color))
-        self.scope.write('VBS app.Display.C2Color="{0}"'.format(c2_color))
-        self.scope.write('VBS app.Display.C3Color="{0}"'.format(c3_color))
-        self.scope.write('VBS app.Display.C4Color="{0}"'.format(c4_color))
-        self.scope.write('VBS app.Display.C5Color="{0}"'.format(c5_color))
-        self.scope.write('VBS app.Display.C6Color="{0}"'.format(c6_color))
-        self.scope.write('VBS app.Display.C7Color="{0}"'.format(c7_color))
-        self.scope.write('VBS app.Display.C8Color="{0}"'.format(c8_color))
-        self.scope.write('VBS app.Display.C1PrintColor="{0}"'.format(c1_color))
-        self.scope.write('VBS app.Display.C2PrintColor="{0}"'.format(c2_color))
-        self.scope.write('VBS app.Display.C3PrintColor="{0}"'.format(c3_color))
-        self.scope.write('VBS app.Display.C4PrintColor="{0}"'.format(c4_color))
-        self.scope.write('VBS app.Display.C5PrintColor="{0}"'.format(c5_color))
-        self.scope.write('VBS app.Display.C6PrintColor="{0}"'.format(c6_color))
-        self.scope.write('VBS app.Display.C7PrintColor="{0}"'.format(c7_color))
-        self.scope.write('VBS app.Display.C8PrintColor="{0}"'.format(c8_color))
+        self.write('VBS app.Hardcopy.PrintLogo=False')
+        self.write('VBS app.Display.C1Color="{0}"'.format(c1_color))
+        self.write('VBS app.Display.C2Color="{0}"'.format(c2_color))
+        self.write('VBS app.Display.C3Color="{0}"'.format(c3_color))
+        self.write('VBS app.Display.C4Color="{0}"'.format(c4_color))
+        self.write('VBS app.Display.C5Color="{0}"'.format(c5_color))
+        self.write('VBS app.Display.C6Color="{0}"'.format(c6_color))
+        self.write('VBS app.Display.C7Color="{0}"'.format(c7_color))
+        self.write('VBS app.Display.C8Color="{0}"'.format(c8_color))
+        self.write('VBS app.Display.C1PrintColor="{0}"'.format(c1_color))
+        self.write('VBS app.Display.C2PrintColor="{0}"'.format(c2_color))
+        self.write('VBS app.Display.C3PrintColor="{0}"'.format(c3_color))
+        self.write('VBS app.Display.C4PrintColor="{0}"'.format(c4_color))
+        self.write('VBS app.Display.C5PrintColor="{0}"'.format(c5_color))
+        self.write('VBS app.Display.C6PrintColor="{0}"'.format(c6_color))
+        self.write('VBS app.Display.C7PrintColor="{0}"'.format(c7_color))
+        self.write('VBS app.Display.C8PrintColor="{0}"'.format(c8_color))
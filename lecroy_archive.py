@@ -0,0 +1,235 @@
+#!/usr/bin/python
+import json
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+import lecroy_waveform
+
+# Compact archive of captured channels: the native ADC codes (int8/int16) with their WAVEDESC scaling, plus the
+# setup dictionaries of the scope, in one file that can be sliced without reading all of it.
+#
+# File layout:
+#   'LECROYARCHIVE1\n\0'                  16 bytes
+#   chunks                                each one chunk_points codes, compressed or not
+#   index                                 JSON: setup, and per channel desc, dtype, shape and the chunk table
+#   index offset, 'LCYA'                  8 byte little endian offset of the index, 4 byte end marker
+#
+# compression:
+#   'none'        raw codes, the reader maps them straight from the file
+#   'zlib'        each chunk zlib compressed
+#   'delta+zlib'  first difference of the codes in each chunk (wraps around, so it is exact), then zlib.
+#                 Neighbouring samples are close, so this compresses the best.
+#
+# Example:
+#     save_capture(scope, 'fail_0042.lca', ['C1', 'C8'])
+#     archive = archive_reader('fail_0042.lca')
+#     trace = archive['C1']
+#     volts = trace.volts(slice(0, 100000))          # only the chunks holding these points are read
+#     analog_channels = archive.setup['analog']
+
+magic      = b'LECROYARCHIVE1\n\x00'
+end_marker = b'LCYA'
+
+
+def json_value(value):
+    # setup dictionaries have int keys and tuple values, JSON has neither
+    if isinstance(value, dict):
+        return {'__dict__': [[json_value(k), json_value(v)] for k, v in value.items()]}
+    if isinstance(value, tuple):
+        return {'__tuple__': [json_value(v) for v in value]}
+    if isinstance(value, list):
+        return [json_value(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def python_value(value):
+    if isinstance(value, dict) and '__dict__' in value:
+        return {python_value(k): python_value(v) for k, v in value['__dict__']}
+    if isinstance(value, dict) and '__tuple__' in value:
+        return tuple(python_value(v) for v in value['__tuple__'])
+    if isinstance(value, list):
+        return [python_value(v) for v in value]
+    return value
+
+
+class archive_writer():
+
+    def __init__(self, path_with_filename, setup=None, compression='delta+zlib', chunk_points=1 << 20, level=6):
+        """
+        :param setup: dictionary stored with the data, e.g. {'analog': get_analog_channel_setup(), ...}
+        :param compression: 'none', 'zlib' or 'delta+zlib'
+        :param chunk_points: codes per chunk, the smallest piece a reader decompresses
+        :param level: zlib level, 1 is fastest and 9 smallest
+        """
+        if compression not in ('none', 'zlib', 'delta+zlib'):
+            raise ValueError("compression must be 'none', 'zlib' or 'delta+zlib'")
+        self.path_with_filename = path_with_filename
+        self.compression        = compression
+        self.chunk_points       = chunk_points
+        self.level              = level
+        self.index              = {'setup': json_value(setup or {}), 'channels': {}}
+        self.file_stream        = open(path_with_filename, 'wb')
+        self.file_stream.write(magic)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, name, wave):
+        """
+        :param name: e.g. 'C1'
+        :param wave: lecroy_waveform.waveform, codes can be 1D or (segment, point) and also a np.memmap
+        """
+        codes = wave.codes
+        dtype = codes.dtype.newbyteorder('<')
+        flat = codes.reshape(-1)
+        chunks = []
+        for first in range(0, flat.size, self.chunk_points):
+            data = flat[first:first + self.chunk_points].astype(dtype, copy=False)
+            if self.compression == 'delta+zlib':
+                data = np.concatenate([data[:1], np.diff(data)]).astype(dtype, copy=False)
+            payload = data.tobytes()
+            if self.compression != 'none':
+                payload = zlib.compress(payload, self.level)
+            chunks.append([self.file_stream.tell(), len(payload), first, int(min(self.chunk_points, flat.size - first))])
+            self.file_stream.write(payload)
+        desc = {key: value for key, value in wave.desc.items() if isinstance(value, (int, float, str))}
+        self.index['channels'][name] = {
+            'dtype': dtype.str, 'shape': list(codes.shape), 'desc': desc, 'compression': self.compression,
+            'chunk_points': self.chunk_points, 'chunks': chunks,
+            'trigger_times': None if wave.trigger_times is None else np.asarray(wave.trigger_times).tolist()}
+
+    def close(self):
+        if self.file_stream is None:
+            return
+        offset = self.file_stream.tell()
+        self.file_stream.write(json.dumps(self.index).encode())
+        self.file_stream.write(struct.pack('<Q', offset) + end_marker)
+        self.file_stream.close()
+        self.file_stream = None
+
+
+class archived_channel():
+    """
+    One channel of an archive, nothing is read until it is sliced.
+    """
+
+    def __init__(self, data, entry):
+        self.data          = data   # mmap of the archive file
+        self.entry         = entry
+        self.dtype         = np.dtype(entry['dtype'])
+        self.shape         = tuple(entry['shape'])
+        self.desc          = dict(entry['desc'], dtype=self.dtype)
+        self.trigger_times = entry['trigger_times']
+        if self.trigger_times is not None:
+            self.trigger_times = np.array([tuple(row) for row in self.trigger_times], dtype=lecroy_waveform.trigger_time_dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def chunk(self, number):
+        offset, length, first, count = self.entry['chunks'][number]
+        if self.entry['compression'] == 'none':
+            return np.frombuffer(self.data, dtype=self.dtype, count=count, offset=offset)
+        codes = np.frombuffer(zlib.decompress(self.data[offset:offset + length]), dtype=self.dtype)
+        if self.entry['compression'] == 'delta+zlib':
+            codes = np.cumsum(codes, dtype=self.dtype)
+        return codes
+
+    def flat(self, start, stop):
+        # codes start..stop of the flattened array, only the chunks holding them are read
+        start, stop = max(start, 0), min(stop, self.size)
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        chunk_points = self.entry['chunk_points']
+        first_chunk, last_chunk = start // chunk_points, (stop - 1) // chunk_points
+        if first_chunk == last_chunk:
+            base = first_chunk * chunk_points
+            return self.chunk(first_chunk)[start - base:stop - base]
+        result = np.empty(stop - start, dtype=self.dtype)
+        for number in range(first_chunk, last_chunk + 1):
+            base = number * chunk_points
+            codes = self.chunk(number)
+            low, high = max(start, base), min(stop, base + len(codes))
+            result[low - start:high - start] = codes[low - base:high - base]
+        return result
+
+    def __getitem__(self, key):
+        """
+        codes of the first axis (segments, or points of a 1D capture), e.g. trace[10], trace[100:200]
+        """
+        row = int(np.prod(self.shape[1:]))
+        if isinstance(key, (int, np.integer)):
+            key = key + len(self) if key < 0 else key
+            if not 0 <= key < len(self):
+                raise IndexError(key)
+            codes = self.flat(key * row, (key + 1) * row)
+            return codes.reshape(self.shape[1:]) if len(self.shape) > 1 else codes[0]
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            stop = max(stop, start)
+            return self.flat(start * row, stop * row).reshape((stop - start,) + self.shape[1:])
+        return self.flat(0, self.size).reshape(self.shape)[key]
+
+    def volts(self, key=slice(None)):
+        return self[key] * self.desc['vertical_gain'] - self.desc['vertical_offset']
+
+    def waveform(self):
+        # the whole channel as a lecroy_waveform.waveform, e.g. for lecroy_measure.measure_waveforms
+        return lecroy_waveform.waveform(self.desc, self.flat(0, self.size).reshape(self.shape), self.trigger_times)
+
+
+class archive_reader():
+
+    def __init__(self, path_with_filename):
+        self.file_stream = open(path_with_filename, 'rb')
+        self.data = mmap.mmap(self.file_stream.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(magic)] != magic or self.data[-4:] != end_marker:
+            raise ValueError("{0} is not a complete lecroy archive".format(path_with_filename))
+        offset = struct.unpack('<Q', self.data[-12:-4])[0]
+        self.index = json.loads(self.data[offset:-12].decode())
+        self.setup = python_value(self.index['setup'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # slices of 'none' compression are views on the mapping, it is then unmapped when the last of them is gone
+        try:
+            self.data.close()
+        except BufferError:
+            pass
+        self.file_stream.close()
+
+    def channels(self):
+        return list(self.index['channels'])
+
+    def __getitem__(self, name):
+        return archived_channel(self.data, self.index['channels'][name])
+
+
+def save_capture(scope, path_with_filename, channels=('C1',), compression='delta+zlib', chunk_points=1 << 20):
+    """
+    Downloads channels from a lecroy scope and archives them with the analog, trigger and horizontal setup.
+    :return: size of the archive in bytes
+    """
+    setup = {'analog': scope.get_analog_channel_setup(),
+             'trigger': scope.get_trigger_setup(),
+             'horizontal_scale': scope.get_horizontal_scale()}
+    with archive_writer(path_with_filename, setup, compression, chunk_points) as archive:
+        for channel in channels:
+            archive.add(channel, scope.get_waveform(channel))
+    return os.path.getsize(path_with_filename)
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class screen_capture():
+    """
+    Takes screen images in the background: capture() queues a hardcopy and returns a future right away.
+    One thread reads the PNGs from the scope (in order, holding the scope lock for each transfer) and
+    another one writes them to disk, so neither the image transfer nor the file write stalls the caller.
+
+    Example:
+        capture = screen_capture(scope)
+        future = capture.capture('before_trigger')
+        ...                                                   # keep testing while the image is transferred
+        futures = capture.burst(10, cadence=0.5, path_with_filename='ramp')
+        paths = [f.result() for f in futures]                 # ramp_0000.png .. ramp_0009.png
+        capture.close()
+    """
+
+    def __init__(self, scope, chunk_size=1024 * 1024, max_pending=16):
+        """
+        :param scope: lecroy
+        :param chunk_size: bytes per read of the PNG transfer
+        :param max_pending: captures queued or being written before capture() waits (back pressure)
+        """
+        self.scope      = scope
+        self.chunk_size = chunk_size
+        self.pending    = threading.BoundedSemaphore(max_pending)
+        self.transfer   = ThreadPoolExecutor(max_workers=1)  # scope I/O, in the order requested
+        self.writer     = ThreadPoolExecutor(max_workers=1)  # disk I/O
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # waits for every queued capture to be written
+        self.transfer.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+    def capture(self, path_with_filename='', backcolor='WHITE', at_time=None):
+        """
+        :param path_with_filename: same as lecroy.get_screen_image, a unique name is made when empty
+        :param at_time: time.monotonic() value to wait for before the hardcopy, None is as soon as possible
+        :return: concurrent.futures.Future with the path of the written file
+        """
+        self.pending.acquire()
+        done = Future()
+        path_with_filename = self.scope.screen_image_filename(path_with_filename)
+        try:
+            self.transfer.submit(self.read, done, path_with_filename, backcolor, at_time)
+        except Exception:
+            self.pending.release()
+            raise
+        return done
+
+    def burst(self, count, cadence=0.0, path_with_filename='', backcolor='WHITE'):
+        """
+        Queues count captures, cadence seconds apart (measured from now, so late transfers do not add up).
+        :param path_with_filename: base name, '_0000'.. is appended, default names when empty
+        :return: list of futures, in capture order
+        """
+        start = time.monotonic()
+        base = path_with_filename[:-4] if path_with_filename.endswith('.png') else path_with_filename
+        futures = []
+        for index in range(count):
+            name = '{0}_{1:04d}.png'.format(base, index) if base else ''
+            futures.append(self.capture(name, backcolor, start + index * cadence))
+        return futures
+
+    def read(self, done, path_with_filename, backcolor, at_time):
+        if not done.set_running_or_notify_cancel():
+            self.pending.release()
+            return
+        try:
+            if at_time is not None:
+                time.sleep(max(at_time - time.monotonic(), 0.0))
+            raw_data = self.scope.read_screen_image(backcolor, self.chunk_size)
+            self.writer.submit(self.store, done, path_with_filename, raw_data)
+        except Exception as error:
+            done.set_exception(error)
+            self.pending.release()
+
+    def store(self, done, path_with_filename, raw_data):
+        try:
+            directory = os.path.dirname(path_with_filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path_with_filename, 'wb') as file_stream:
+                file_stream.write(raw_data)
+            done.set_result(path_with_filename)
+        except Exception as error:
+            done.set_exception(error)
+        finally:
+            self.pending.release()
+
+
+class capture_loop():
+    """
+    Overlaps acquisition with transfer and processing in a per-DUT capture loop.
+    After each trigger the channels are copied into the scope's memory traces (STO C1,M1, done inside the scope)
+    and the scope is re-armed right away, so the next acquisition runs while M1.. are downloaded. The downloaded
+    data then goes to a worker thread for processing, through a queue of queue_depth entries: when processing
+    falls behind, the loop waits (back pressure) instead of piling up captures in memory.
+    With a readout function (e.g. one that reads get_all_measurements, which needs the live acquisition)
+    the readout runs before re-arming and only the processing is overlapped.
+
+    Example:
+        loop = capture_loop(scope, channels=['C1', 'C8'],
+                            process=lambda index, waves: lecroy_measure.measure_waveforms(waves, ['max']))
+        results = loop.run(100)
+        print(loop.stats['captures_per_minute'])
+    """
+
+    memories = ('M1', 'M2', 'M3', 'M4')
+
+    def __init__(self, scope, channels=('C1',), process=None, readout=None, queue_depth=4, timeout=10.0):
+        """
+        :param scope: lecroy
+        :param channels: channels staged into M1..M4 and downloaded (4 at most), when readout is None
+        :param process: process(index, data) runs on the worker thread, its return values are collected
+        :param readout: readout(scope) returns the data of one capture, called before re-arming
+        :param queue_depth: captures waiting for processing before the loop waits
+        :param timeout: seconds to wait for each trigger
+        """
+        if readout is None and len(channels) > len(self.memories):
+            raise ValueError("at most {0} channels can be staged in memory traces".format(len(self.memories)))
+        self.scope       = scope
+        self.channels    = list(channels)
+        self.process     = process
+        self.readout     = readout
+        self.queue_depth = queue_depth
+        self.timeout     = timeout
+        self.stats       = {}
+
+    def download(self):
+        # memory traces of the staged channels, returned under the channel names
+        waves = self.scope.get_waveforms(self.memories[:len(self.channels)])
+        return {channel: waves[memory] for channel, memory in zip(self.channels, self.memories)}
+
+    def worker(self, pending, results):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            index, data = item
+            try:
+                results[index] = self.process(index, data) if self.process is not None else data
+            except Exception as error:
+                results[index] = error
+
+    def run(self, count):
+        """
+        :param count: number of captures
+        :return: list with the process result (or the exception it raised, or None on a trigger timeout)
+                 of each capture, in order
+        """
+        results = [None] * count
+        pending = queue.Queue(maxsize=self.queue_depth)
+        worker = threading.Thread(target=self.worker, args=(pending, results), name='capture_loop', daemon=True)
+        worker.start()
+        stage = ';'.join('STO {0},{1}'.format(channel, memory) for channel, memory in zip(self.channels, self.memories))
+        timeouts = 0
+        waited = 0.0
+        start = time.monotonic()
+        try:
+            self.scope.arm_single()
+            for index in range(count):
+                if not self.scope.wait_for_trigger(self.timeout):
+                    timeouts += 1
+                    self.scope.arm_single()
+                    continue
+                if self.readout is not None:
+                    data = self.readout(self.scope)
+                    if index + 1 < count:
+                        self.scope.arm_single()
+                else:
+                    self.scope.write(stage)
+                    if index + 1 < count:
+                        self.scope.arm_single()  # the next acquisition runs during the download
+                    data = self.download()
+                before = time.monotonic()
+                pending.put((index, data))  # waits while queue_depth captures are not processed yet
+                waited += time.monotonic() - before
+        finally:
+            pending.put(None)
+            worker.join()
+        elapsed = time.monotonic() - start
+        self.stats = {'captures': count - timeouts, 'timeouts': timeouts, 'elapsed': elapsed,
+                      'backpressure_wait': waited,
+                      'captures_per_minute': 60.0 * (count - timeouts) / elapsed if elapsed > 0 else 0.0}
+        return results
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class scope_group():
+    """
+    Runs the same lecroy method on several scopes at once, one thread per scope, so a rack wide
+    operation takes about as long as the slowest scope. Calls to one scope are serialized by its own lock.
+    A scope that raises does not stop the others, its exception is returned as its result.
+
+    Example:
+        rm = pyvisa.ResourceManager()
+        group = scope_group({'cell1': lecroy(rm.open_resource(address1)),
+                             'cell2': lecroy(rm.open_resource(address2))})
+        group.channel_setup(analog_channels, digital_channels)
+        group.get_screen_image(per_scope={'cell1': {'path_with_filename': 'cell1'},
+                                          'cell2': {'path_with_filename': 'cell2'}})
+        triggered = group.arm_and_wait(timeout=5)
+        results = group.get_all_measurements()
+    """
+
+    def __init__(self, scopes, max_workers=None):
+        """
+        :param scopes: dictionary of name -> lecroy
+        :param max_workers: number of threads, default is one per scope (arm_and_wait needs one per scope)
+        """
+        self.scopes = dict(scopes)
+        self.locks  = {name: threading.RLock() for name in self.scopes}
+        self.pool   = ThreadPoolExecutor(max_workers=max_workers or max(len(self.scopes), 1))
+        self.errors = {}  # name -> exception of the last run
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __getattr__(self, method):
+        # group.channel_setup(...) runs scope.channel_setup(...) on every scope
+        if method.startswith('_') or method in ('scopes', 'locks', 'pool', 'errors'):
+            raise AttributeError(method)
+        def run_method(*args, **kwargs):
+            return self.run(method, *args, **kwargs)
+        return run_method
+
+    def call(self, name, method, *args, **kwargs):
+        # runs one method on one scope, holding that scope's lock
+        with self.locks[name]:
+            if callable(method):
+                return method(self.scopes[name], *args, **kwargs)
+            return getattr(self.scopes[name], method)(*args, **kwargs)
+
+    def run(self, method, *args, per_scope=None, names=None, **kwargs):
+        """
+        :param method: name of a lecroy method, or a function called as method(scope, *args, **kwargs)
+        :param per_scope: dictionary of name -> kwargs that are added for that scope only
+        :param names: scopes to run on, default is all of them
+        :return: dictionary of name -> result, or the exception that scope raised
+        """
+        per_scope = per_scope or {}
+        futures = {}
+        for name in (names or self.scopes):
+            scope_kwargs = dict(kwargs, **per_scope.get(name, {}))
+            futures[name] = self.pool.submit(self.call, name, method, *args, **scope_kwargs)
+        return self.gather(futures)
+
+    def gather(self, futures):
+        results = {}
+        self.errors = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as error:
+                results[name] = error
+                self.errors[name] = error
+        return results
+
+    def arm_and_wait(self, timeout=10.0, names=None):
+        """
+        Arms all scopes as close together as possible (every thread waits at a barrier before ARM),
+        then waits for all of them to trigger.
+        :return: dictionary of name -> True when triggered, False on timeout, or the exception
+        """
+        names = list(names or self.scopes)
+        barrier = threading.Barrier(len(names))
+        def arm(scope):
+            try:
+                scope.query('INR?')  # clear the new acquisition flag
+            except Exception:
+                barrier.abort()  # do not keep the other scopes waiting
+                raise
+            try:
+                barrier.wait(timeout)
+            except threading.BrokenBarrierError:
+                pass  # another scope failed, still arm this one
+            scope.write('ARM')
+            return scope.wait_for_trigger(timeout)
+        futures = {}
+        for name in names:
+            futures[name] = self.pool.submit(self.call, name, arm)
+        return self.gather(futures)
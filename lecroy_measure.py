@@ -0,0 +1,182 @@
+#!/usr/bin/python
+import numpy as np
+
+# Host-side versions of the scope measurements (ParamEngine names), computed over the last axis of an array
+# so all segments (and stacked channels) are measured at once. Like on the scope, the 20/50/80% levels are
+# taken between the top and the base of each trace, so overshoot and ringing do not move them.
+parameters = ('max', 'min', 'pkpk', 'mean', 'median', 'rms', 'top', 'base', 'amplitude', 'level@x', 'rise2080',
+              'fall8020', 'freq', 'duty', 'delay')
+top_base_parameters = ('top', 'base', 'amplitude', 'rise2080', 'fall8020', 'freq', 'duty', 'delay')
+
+
+def take(values, index):
+    # values[..., index] with a different index for every trace
+    return np.take_along_axis(values, index[..., None], axis=-1)[..., 0]
+
+
+def top_base(volts, bins=256):
+    """
+    Top and base the way the scope finds them: the most common level (histogram mode) of the upper and of the
+    lower half of the range of each trace. The max (min) is used when the half has no clear mode, e.g. a triangle.
+    :return: (top, base), arrays with the shape of volts without the last axis
+    """
+    low  = volts.min(axis=-1)
+    high = volts.max(axis=-1)
+    span = np.where(high > low, high - low, 1.0)
+    index = np.minimum(((volts - low[..., None]) * (bins / span)[..., None]).astype(np.intp), bins - 1)
+    traces = int(np.prod(volts.shape[:-1]))
+    index = index.reshape(traces, -1) + (np.arange(traces) * bins)[:, None]
+    counts = np.bincount(index.ravel(), minlength=traces * bins).reshape(volts.shape[:-1] + (bins,))
+    sums = np.bincount(index.ravel(), volts.reshape(-1), minlength=traces * bins).reshape(counts.shape)
+    half = bins // 2
+    results = []
+    for part, first, extreme in ((slice(half, None), half, high), (slice(None, half), 0, low)):
+        part_counts = counts[..., part]
+        mode = part_counts.argmax(axis=-1)
+        count = take(part_counts, mode)
+        clear = count >= 2 * part_counts.sum(axis=-1) / part_counts.shape[-1]  # well above an even spread
+        with np.errstate(divide='ignore', invalid='ignore'):
+            level = take(sums, mode + first) / count  # mean of the samples in the mode bin
+        results.append(np.where(clear & (count > 0), level, extreme))
+    return tuple(results)
+
+
+def levels(volts, fraction, reference=None):
+    # fraction of the way from the base to the top, reference is (top, base) when already known
+    top, base = top_base(volts) if reference is None else reference
+    return base + fraction * (top - base)
+
+
+def edges(volts, level, rising=True):
+    # boolean (..., n-1), True between the two samples where the trace crosses level
+    above = volts >= level[..., None]
+    if rising:
+        return ~above[..., :-1] & above[..., 1:]
+    return above[..., :-1] & ~above[..., 1:]
+
+
+def interpolate(volts, level, index):
+    # fractional sample position where the trace crosses level, between index and index + 1
+    v0 = take(volts, index)
+    v1 = take(volts, index + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(v1 != v0, (level - v0) / (v1 - v0), 0.0)
+    return index + fraction
+
+
+def first_crossing(volts, level, rising=True, start=None):
+    """
+    :param start: fractional positions, only crossings at or after them are considered (nan for none)
+    :return: fractional sample position of the first crossing of each trace, nan if there is none
+    """
+    edge = edges(volts, level, rising)
+    if start is not None:
+        valid = ~np.isnan(start)
+        edge &= valid[..., None] & (np.arange(edge.shape[-1]) >= np.floor(np.where(valid, start, 0))[..., None])
+    found = edge.any(axis=-1)
+    index = edge.argmax(axis=-1)
+    return np.where(found, interpolate(volts, level, index), np.nan)
+
+
+def transition(volts, interval, rising, reference):
+    low_level  = levels(volts, 0.2, reference)
+    high_level = levels(volts, 0.8, reference)
+    if rising:
+        begin = first_crossing(volts, low_level, True)
+        end   = first_crossing(volts, high_level, True, begin)
+    else:
+        begin = first_crossing(volts, high_level, False)
+        end   = first_crossing(volts, low_level, False, begin)
+    return (end - begin) * interval
+
+
+def cycles(volts, level):
+    # first and last rising crossing of level (fractional positions) and the number of rising crossings
+    edge  = edges(volts, level, True)
+    count = edge.sum(axis=-1)
+    first = edge.argmax(axis=-1)
+    last  = edge.shape[-1] - 1 - edge[..., ::-1].argmax(axis=-1)
+    return interpolate(volts, level, first), interpolate(volts, level, last), first, last, count
+
+
+def level_at_x(volts, interval, offset, position):
+    point = (position - offset) / interval
+    index = np.clip(int(np.floor(point)), 0, volts.shape[-1] - 2)
+    if point < 0 or point > volts.shape[-1] - 1:
+        return np.full(volts.shape[:-1], np.nan)
+    fraction = point - index
+    return volts[..., index] * (1 - fraction) + volts[..., index + 1] * fraction
+
+
+def measure(volts, params=parameters, interval=1.0, offset=0.0, position=0.0):
+    """
+    Measures every trace of volts at once.
+    :param volts: array (..., points), e.g. (segment, point) or (channel, segment, point)
+    :param params: names from parameters, e.g. ['max', 'level@x']
+    :param interval: seconds between points (horiz_interval)
+    :param offset: time of the first point relative to the trigger (horiz_offset)
+    :param position: time used by 'level@x'
+    :return: dictionary of param -> array with the shape of volts without the last axis
+    """
+    volts = np.asarray(volts, dtype=float)
+    results = {}
+    # one histogram pass for all of the parameters that need top and base
+    reference = top_base(volts) if any(param in top_base_parameters for param in params) else None
+    for param in params:
+        if param == 'max':
+            results[param] = volts.max(axis=-1)
+        elif param == 'min':
+            results[param] = volts.min(axis=-1)
+        elif param == 'pkpk':
+            results[param] = np.ptp(volts, axis=-1)
+        elif param == 'mean':
+            results[param] = volts.mean(axis=-1)
+        elif param == 'median':
+            results[param] = np.median(volts, axis=-1)
+        elif param == 'rms':
+            results[param] = np.sqrt(np.mean(volts * volts, axis=-1))
+        elif param in ('top', 'base', 'amplitude'):
+            top, base = reference
+            results[param] = {'top': top, 'base': base, 'amplitude': top - base}[param]
+        elif param == 'level@x':
+            results[param] = level_at_x(volts, interval, offset, position)
+        elif param == 'rise2080':
+            results[param] = transition(volts, interval, True, reference)
+        elif param == 'fall8020':
+            results[param] = transition(volts, interval, False, reference)
+        elif param in ('freq', 'duty'):
+            level = levels(volts, 0.5, reference)
+            first_pos, last_pos, first, last, count = cycles(volts, level)
+            if param == 'freq':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    results[param] = np.where(count > 1, (count - 1) / ((last_pos - first_pos) * interval), np.nan)
+            else:
+                high = np.cumsum(volts >= level[..., None], axis=-1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    results[param] = np.where(count > 1, (take(high, last) - take(high, first)) / (last - first), np.nan)
+        elif param == 'delay':
+            level = levels(volts, 0.5, reference)
+            rising  = first_crossing(volts, level, True)
+            falling = first_crossing(volts, level, False)
+            results[param] = offset + np.fmin(rising, falling) * interval
+        else:
+            raise ValueError("unknown measurement '{0}', valid ones are {1}".format(param, ', '.join(parameters)))
+    return results
+
+
+def measure_waveforms(waveforms, params=parameters, position=0.0):
+    """
+    Measures downloaded waveforms (see lecroy.get_waveforms), all segments of each channel at once.
+    :param waveforms: dictionary of channel -> lecroy_waveform.waveform
+    :return: columnar dictionary, 'channel' and 'segment' columns plus one column per param, one row per trace
+    """
+    columns = {'channel': [], 'segment': []}
+    columns.update({param: [] for param in params})
+    for channel, wave in waveforms.items():
+        results = measure(wave.volts, params, wave.desc['horiz_interval'], wave.desc['horiz_offset'], position)
+        rows = int(np.prod(wave.codes.shape[:-1]))
+        columns['channel'].append(np.full(rows, channel))
+        columns['segment'].append(np.arange(rows))
+        for param in params:
+            columns[param].append(np.ravel(results[param]))
+    return {name: np.concatenate(column) if column else np.array([]) for name, column in columns.items()}
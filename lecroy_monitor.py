@@ -0,0 +1,173 @@
+#!/usr/bin/python
+import math
+import threading
+import time
+import numpy as np
+
+
+class ring():
+    """
+    Preallocated ring buffer of rows, the memory used never grows.
+    times is (capacity,) and each array in data is (capacity, columns).
+    """
+
+    def __init__(self, capacity, columns, names=('value',)):
+        self.capacity = capacity
+        self.count    = 0   # rows written so far, also past the capacity
+        self.times    = np.full(capacity, np.nan)
+        self.data     = {name: np.full((capacity, columns), np.nan) for name in names}
+
+    def push(self, timestamp, **rows):
+        index = self.count % self.capacity
+        self.times[index] = timestamp
+        for name, row in rows.items():
+            self.data[name][index] = row
+        self.count += 1
+
+    def views(self, array):
+        # oldest first, one view or two when the buffer has wrapped, nothing is copied
+        if self.count <= self.capacity:
+            return (array[:self.count],)
+        head = self.count % self.capacity
+        return (array[head:], array[:head])
+
+    def snapshot(self):
+        """
+        :return: dictionary of 'time' and the data names -> tuple of views (oldest first)
+        """
+        result = {'time': self.views(self.times)}
+        for name, array in self.data.items():
+            result[name] = self.views(array)
+        return result
+
+
+class measurement_monitor():
+    """
+    Samples measurements on a fixed schedule in a background thread, for soak and burn-in tests that run for hours.
+    Each sample is one get_all_measurements call. The raw samples go into a ring buffer, and each
+    decimation tier keeps the min, max and mean of every interval (1 s and 1 min by default) in its own ring buffer.
+
+    Example:
+        monitor = measurement_monitor(scope, slots=[1, 10], stats=('value', 'max'), period=0.2)
+        monitor.add_threshold(10, 'value', high=1.5, callback=lambda m, slot, stat, value, t: print('over', value))
+        monitor.start()
+        ...
+        history = monitor.snapshot(tier=60.0)   # per minute min/max/mean, as views
+        monitor.stop()
+    """
+
+    def __init__(self, scope, slots=(1,), stats=('value',), period=1.0, capacity=100000,
+                 tiers=((1.0, 86400), (60.0, 43200))):
+        """
+        :param scope: lecroy
+        :param slots: measurement numbers, 1 is 'P1'
+        :param stats: any of 'value', 'mean', 'max', 'min', 'sdev', 'num'
+        :param period: seconds between samples
+        :param capacity: raw samples kept
+        :param tiers: (interval in seconds, number of intervals kept) of each decimation tier
+        """
+        self.scope      = scope
+        self.slots      = list(slots)
+        self.stats      = list(stats)
+        self.columns    = [(slot, stat) for slot in self.slots for stat in self.stats]
+        self.period     = period
+        self.raw        = ring(capacity, len(self.columns))
+        self.tiers      = {interval: ring(count, len(self.columns), ('min', 'max', 'mean')) for interval, count in tiers}
+        self.buckets    = {interval: None for interval in self.tiers}  # (start, min, max, sum, count) being filled
+        self.thresholds = []
+        self.missed     = 0    # samples skipped because the previous one took too long
+        self.errors     = 0
+        self.last_error = None
+        self.lock       = threading.Lock()
+        self.running    = threading.Event()
+        self.thread     = None
+
+    def column(self, slot, stat='value'):
+        return self.columns.index((slot, stat))
+
+    def add_threshold(self, slot, stat='value', low=None, high=None, callback=None):
+        """
+        Calls callback(monitor, slot, stat, value, time) when the value goes below low or above high.
+        It is called once when the value leaves the limits, and again only after it has been back inside.
+        """
+        self.thresholds.append({'column': self.column(slot, stat), 'slot': slot, 'stat': stat,
+                                'low': low, 'high': high, 'callback': callback, 'outside': False})
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name='measurement_monitor', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        # sample times are start + n * period, a late sample does not push the following ones back
+        start = time.monotonic()
+        tick = 0
+        while self.running.is_set():
+            delay = start + tick * self.period - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                if not self.running.is_set():
+                    break
+            try:
+                self.sample()
+            except Exception as error:
+                self.errors += 1
+                self.last_error = error
+            late = int((time.monotonic() - start) / self.period) - tick
+            if late > 0:
+                self.missed += late
+            tick += 1 + max(late, 0)
+
+    def sample(self):
+        results = self.scope.get_all_measurements(self.slots)
+        timestamp = time.time()
+        row = np.array([results.get(slot, {}).get(stat, math.nan) for slot, stat in self.columns], dtype=float)
+        with self.lock:
+            self.raw.push(timestamp, value=row)
+            for interval in self.tiers:
+                self.decimate(interval, timestamp, row)
+        for threshold in self.thresholds:
+            value = row[threshold['column']]
+            outside = ((threshold['low'] is not None and value < threshold['low']) or
+                       (threshold['high'] is not None and value > threshold['high']))
+            if outside and not threshold['outside'] and threshold['callback'] is not None:
+                threshold['callback'](self, threshold['slot'], threshold['stat'], value, timestamp)
+            threshold['outside'] = outside
+        return row
+
+    def decimate(self, interval, timestamp, row):
+        bucket_start = math.floor(timestamp / interval) * interval
+        bucket = self.buckets[interval]
+        if bucket is not None and bucket[0] != bucket_start:
+            empty = bucket[4] == 0  # e.g. a 'No Data' slot during the whole interval
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = bucket[3] / bucket[4]
+            self.tiers[interval].push(bucket[0], min=np.where(empty, np.nan, bucket[1]),
+                                      max=np.where(empty, np.nan, bucket[2]), mean=mean)
+            bucket = None
+        valid = ~np.isnan(row)
+        if bucket is None:
+            bucket = (bucket_start, np.full(len(row), np.inf), np.full(len(row), -np.inf),
+                      np.zeros(len(row)), np.zeros(len(row)))
+            self.buckets[interval] = bucket
+        np.fmin(bucket[1], row, out=bucket[1])
+        np.fmax(bucket[2], row, out=bucket[2])
+        bucket[3][valid] += row[valid]
+        bucket[4][valid] += 1
+
+    def snapshot(self, tier=None):
+        """
+        :param tier: None for the raw samples, or the interval of a decimation tier (e.g. 1.0 or 60.0)
+        :return: dictionary of 'time' and 'value' (raw) or 'min', 'max', 'mean' (tier) -> tuple of views on the
+                 ring buffer, oldest first, one view or two once the buffer has wrapped. The columns are in the
+                 order of monitor.columns. The views are not copies, they change as new samples come in.
+        """
+        with self.lock:
+            return self.raw.snapshot() if tier is None else self.tiers[tier].snapshot()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+import json
+import math
+import re
+import threading
+from collections import deque
+
+# Records every transaction of a lecroy object, to find out which commands or methods the time goes to.
+#
+# Example:
+#     scope.tracer = tracer()
+#     scope.channel_setup(analog_channels)
+#     for row in scope.tracer.summary('caller'):
+#         print(row)
+#     scope.tracer.export_chrome_trace('setup_trace.json')  # open in chrome://tracing or Perfetto
+#     scope.tracer = None                                      # tracing off, no overhead
+
+
+class tracer():
+
+    buckets = 24  # latency histogram, bucket n counts transactions of 2**(n-1) to 2**n microseconds
+
+    def __init__(self, max_events=100000):
+        """
+        :param max_events: the most recent transactions kept for the exporters, the histogram counts all of them
+        """
+        self.events = deque(maxlen=max_events)
+        self.stats  = {}  # command key -> {'count', 'total', 'max', 'bytes', 'histogram'}
+        self.lock   = threading.Lock()
+
+    def key(self, command):
+        # 'VBS app.Math.F3.Zoom.VerScale=1' -> 'VBS app.Math.F#.Zoom.VerScale', so all channels share a row
+        if command.startswith("VBS '") and ' : ' in command:
+            return 'VBS batch'
+        if command.startswith('VBS?'):
+            # 'VBS? return = a & Chr(30) & b' -> 'VBS? a & ...'
+            expressions = command.split('=', 1)[-1].strip().split(' & ')
+            return re.sub(r'\d+', '#', 'VBS? ' + expressions[0]) + (' & ...' if len(expressions) > 1 else '')
+        command = command.split('=')[0].strip()
+        return re.sub(r'\d+', '#', command) if command else 'read'
+
+    def record(self, direction, command, bytes_out, bytes_in, start, latency, caller):
+        event = {'direction': direction, 'command': command, 'bytes_out': bytes_out, 'bytes_in': bytes_in,
+                 'start': start, 'latency': latency, 'caller': caller}
+        bucket = min(max(int(math.log2(latency * 1e6)) + 1, 0), self.buckets - 1) if latency > 0 else 0
+        with self.lock:
+            self.events.append(event)
+            for key in (self.key(command), 'caller:' + caller):
+                stats = self.stats.get(key)
+                if stats is None:
+                    stats = self.stats[key] = {'count': 0, 'total': 0.0, 'max': 0.0, 'bytes': 0,
+                                               'histogram': [0] * self.buckets}
+                stats['count'] += 1
+                stats['total'] += latency
+                stats['max']    = max(stats['max'], latency)
+                stats['bytes'] += bytes_out + bytes_in
+                stats['histogram'][bucket] += 1
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.stats.clear()
+
+    def summary(self, by='command'):
+        """
+        :param by: 'command' groups by command (channel numbers removed), 'caller' by lecroy method
+        :return: list of (key, count, total seconds, mean seconds, max seconds, bytes), slowest total first
+        """
+        with self.lock:
+            rows = []
+            for key, stats in self.stats.items():
+                if key.startswith('caller:') != (by == 'caller'):
+                    continue
+                rows.append((key.replace('caller:', '', 1), stats['count'], stats['total'],
+                             stats['total'] / stats['count'], stats['max'], stats['bytes']))
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def export_jsonl(self, path_with_filename):
+        # one JSON object per transaction
+        with self.lock:
+            events = list(self.events)
+        with open(path_with_filename, 'w') as file_stream:
+            for event in events:
+                file_stream.write(json.dumps(event) + '\n')
+        return len(events)
+
+    def export_chrome_trace(self, path_with_filename):
+        # Trace Event Format, one complete ('X') event per transaction and one row per lecroy method
+        with self.lock:
+            events = list(self.events)
+        origin = events[0]['start'] if events else 0.0
+        trace = [{'name': event['command'] or event['direction'], 'cat': event['direction'], 'ph': 'X',
+                  'ts': (event['start'] - origin) * 1e6, 'dur': event['latency'] * 1e6, 'pid': 0,
+                  'tid': event['caller'],
+                  'args': {'bytes_out': event['bytes_out'], 'bytes_in': event['bytes_in']}} for event in events]
+        with open(path_with_filename, 'w') as file_stream:
+            json.dump({'traceEvents': trace}, file_stream)
+        return len(trace)
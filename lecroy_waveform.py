@@ -0,0 +1,226 @@
+#!/usr/bin/python
+import struct
+import numpy as np
+
+# WAVEDESC fields (LECROY_2_3 template): byte offset from the start of 'WAVEDESC', struct format
+wavedesc_fields = {
+    'comm_type':        (32,  'h'),    # 0 = byte, 1 = word
+    'comm_order':       (34,  'h'),    # 0 = high byte first, 1 = low byte first
+    'wave_descriptor':  (36,  'i'),    # length of the blocks that follow
+    'user_text':        (40,  'i'),
+    'res_desc1':        (44,  'i'),
+    'trigtime_array':   (48,  'i'),
+    'ris_time_array':   (52,  'i'),
+    'res_array1':       (56,  'i'),
+    'wave_array_1':     (60,  'i'),
+    'instrument_name':  (76,  '16s'),
+    'trace_label':      (96,  '16s'),
+    'wave_array_count': (116, 'i'),
+    'first_valid_pnt':  (124, 'i'),
+    'last_valid_pnt':   (128, 'i'),
+    'subarray_count':   (144, 'i'),    # number of segments in sequence mode
+    'vertical_gain':    (156, 'f'),
+    'vertical_offset':  (160, 'f'),
+    'max_value':        (164, 'f'),    # top of the ADC range, in codes
+    'min_value':        (168, 'f'),    # bottom of the ADC range, in codes
+    'nominal_bits':     (172, 'h'),
+    'horiz_interval':   (176, 'f'),
+    'horiz_offset':     (180, 'd'),
+    'vertunit':         (196, '48s'),
+    'horunit':          (244, '48s'),
+    'record_type':      (316, 'h'),
+    'wave_source':      (344, 'h'),
+}
+wavedesc_length = 346
+
+
+def find_wavedesc(raw):
+    # the block can start with 'C1:WF ALL,#9000001234' or only '#9000001234', depending on CHDR
+    start = raw.find(b'WAVEDESC')
+    if start < 0:
+        raise ValueError("no WAVEDESC block in the {0} bytes received".format(len(raw)))
+    return start
+
+
+def parse_wavedesc(raw, start=None):
+    """
+    Parses the WAVEDESC header of a 'WF?' response.
+    :param raw: bytes (or memoryview) as returned by read_raw
+    :param start: offset of 'WAVEDESC' in raw, found when not given
+    :return: dictionary with the wavedesc_fields plus 'start', 'byte_order', 'dtype' and 'data_offset'
+    """
+    if start is None:
+        start = find_wavedesc(raw)
+    order = '<' if struct.unpack_from('<h', raw, start + 34)[0] == 1 else '>'
+    desc = {'start': start, 'byte_order': order}
+    for name, (offset, fmt) in wavedesc_fields.items():
+        value = struct.unpack_from(order + fmt, raw, start + offset)[0]
+        if isinstance(value, bytes):
+            value = value.split(b'\x00')[0].decode('ascii', 'replace').strip()
+        desc[name] = value
+    desc['dtype'] = np.dtype(np.int16 if desc['comm_type'] == 1 else np.int8).newbyteorder(order)
+    desc['trigtime_offset'] = start + desc['wave_descriptor'] + desc['user_text']
+    desc['data_offset'] = (desc['trigtime_offset'] + desc['trigtime_array'] + desc['ris_time_array'] +
+                           desc['res_array1'])
+    return desc
+
+
+# sequence mode: one (trigger time, trigger offset) pair of doubles per segment
+trigger_time_dtype = np.dtype([('time', 'f8'), ('offset', 'f8')])
+
+
+def parse_trigger_times(raw, desc):
+    count = desc['trigtime_array'] // 16
+    if count == 0:
+        return None
+    return np.frombuffer(raw, dtype=trigger_time_dtype.newbyteorder(desc['byte_order']),
+                         count=count, offset=desc['trigtime_offset'])
+
+
+def parse_waveform(raw, channel=''):
+    """
+    Wraps a complete 'WF? ALL' response without copying the samples.
+    :param raw: bytes as returned by read_raw
+    :param channel: e.g. 'C1', only kept as a name
+    :return: waveform, codes is (segment, point) for a sequence mode capture
+    """
+    desc = parse_wavedesc(raw)
+    count = desc['wave_array_1'] // desc['dtype'].itemsize
+    codes = np.frombuffer(raw, dtype=desc['dtype'], count=count, offset=desc['data_offset'])
+    if desc['subarray_count'] > 1 and count % desc['subarray_count'] == 0:
+        codes = codes.reshape(desc['subarray_count'], -1)
+    return waveform(desc, codes, parse_trigger_times(raw, desc), channel)
+
+
+class waveform():
+    """
+    Samples of one channel as raw ADC codes, with the volts and time axis scaled only when asked for.
+    codes is 1D, or 2D (segment, point) for sequence mode captures.
+    """
+
+    def __init__(self, desc, codes, trigger_times=None, channel=''):
+        self.desc          = desc
+        self.codes         = codes
+        self.trigger_times = trigger_times
+        self.channel       = channel
+        self._volts        = None
+        self._times        = None
+
+    def __len__(self):
+        return self.codes.shape[-1]
+
+    @property
+    def interval(self):
+        return self.desc['horiz_interval']
+
+    @property
+    def volts(self):
+        # vertical_gain * code - vertical_offset, computed on first use
+        if self._volts is None:
+            self._volts = self.codes * self.desc['vertical_gain'] - self.desc['vertical_offset']
+        return self._volts
+
+    @property
+    def times(self):
+        # time of each point relative to the trigger, shared by all segments
+        if self._times is None:
+            self._times = np.arange(len(self)) * self.desc['horiz_interval'] + self.desc['horiz_offset']
+        return self._times
+
+    @property
+    def clipped(self):
+        # True where a sample sits on the top or bottom of the ADC range
+        return (self.codes >= self.desc['max_value']) | (self.codes <= self.desc['min_value'])
+
+
+def pack_lanes(codes, lanes=16, chunk_points=1 << 20):
+    """
+    Turns 16 bit words (bit n is lane n) into one bit per sample per lane.
+    Done chunk_points at a time, so the temporary unpacked bits stay small.
+    :param chunk_points: rounded down to a multiple of 8, so every chunk starts on a packed byte
+    :return: uint8 array (lane, ceil(points / 8)), sample i of a lane is bit i % 8 of byte i // 8
+    """
+    chunk_points = max(chunk_points // 8 * 8, 8)
+    words = np.ascontiguousarray(codes).astype('<u2', copy=False)  # converts the values, also of '>i2' codes
+    packed = np.empty((lanes, (len(words) + 7) // 8), dtype=np.uint8)
+    for first in range(0, len(words), chunk_points):
+        chunk = words[first:first + chunk_points].view(np.uint8).reshape(-1, 2)
+        bits = np.unpackbits(chunk, axis=1, bitorder='little')[:, :lanes]
+        packed[:, first // 8:(first + len(chunk) + 7) // 8] = np.packbits(bits.T, axis=1, bitorder='little')
+    return packed
+
+
+class digital_waveform():
+    """
+    Logic analyzer capture of all lanes, bit-packed: a 16 lane capture takes 2 bytes per sample.
+    Times are in seconds from the trigger, like waveform.times.
+    """
+
+    def __init__(self, desc, packed, points, labels=None):
+        self.desc     = desc
+        self.packed   = packed
+        self.points   = points
+        self.labels   = labels or {}  # lane -> name, e.g. from get_digital_channel_setup
+        self.interval = desc['horiz_interval']
+        self.offset   = desc['horiz_offset']
+
+    def __len__(self):
+        return self.points
+
+    def lane(self, lane):
+        # 0/1 samples of one lane
+        return np.unpackbits(self.packed[lane], count=self.points, bitorder='little')
+
+    def times(self, indexes):
+        return np.asarray(indexes) * self.interval + self.offset
+
+    def edges(self, lane):
+        """
+        :return: (rising, falling) sample indexes, the first sample after each transition
+        """
+        bits = self.lane(lane)
+        change = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+        rising = bits[change] == 1
+        return change[rising], change[~rising]
+
+    def transition_counts(self):
+        # number of transitions of every lane, straight from the packed bytes
+        shifted = (self.packed << 1) | np.concatenate(
+            [self.packed[:, :1] & 1, self.packed[:, :-1] >> 7], axis=1)
+        changes = self.packed ^ shifted
+        tail = self.points % 8
+        if tail:  # ignore the padding bits of the last byte
+            changes[:, -1] &= (1 << tail) - 1
+        return np.unpackbits(changes, axis=1).sum(axis=1)
+
+    def pulse_widths(self, lane, level=1):
+        """
+        :param level: 1 for high pulses, 0 for low pulses
+        :return: seconds of each complete pulse
+        """
+        rising, falling = self.edges(lane)
+        starts, ends = (rising, falling) if level else (falling, rising)
+        ends = ends[np.searchsorted(ends, starts[0]):] if len(starts) else ends
+        count = min(len(starts), len(ends))
+        return (ends[:count] - starts[:count]) * self.interval
+
+    def pulse_histogram(self, lane, level=1, bins=50):
+        # (counts, bin edges in seconds) of the pulse widths
+        return np.histogram(self.pulse_widths(lane, level), bins=bins)
+
+    def delay(self, lane_a, lane_b, edge_a='rising', edge_b='rising'):
+        """
+        Time from every edge_a of lane_a to the next edge_b of lane_b (nan when there is none).
+        :param edge_a: 'rising', 'falling' or 'either'
+        :return: (times of the lane_a edges, delays in seconds)
+        """
+        def select(lane, edge):
+            rising, falling = self.edges(lane)
+            return {'rising': rising, 'falling': falling}.get(edge, np.union1d(rising, falling))
+        starts = select(lane_a, edge_a)
+        ends = select(lane_b, edge_b)
+        following = np.searchsorted(ends, starts)
+        delays = np.full(len(starts), np.nan)
+        found = following < len(ends)
+        delays[found] = (ends[following[found]] - starts[found]) * self.interval
+        return self.times(starts), delays
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+import json
+import re
+import struct
+import zlib
+import random
+import time
+import numpy as np
+
+# Stand-in for a pyvisa instrument connected to a LeCroy scope. It keeps the VBS property tree that lecroy.py
+# writes and reads, answers the binary transfers with synthetic PNG and WAVEDESC waveform payloads, and adds
+# a simulated latency and bandwidth to every transaction.
+#
+# Example:
+#     scope = lecroy(pyvisa_instr=sim_lecroy(latency=0.002, bandwidth=20e6))
+#     scope.channel_setup(analog_channels)
+#     print(scope.scope.stats)
+
+
+class sim_lecroy():
+
+    def __init__(self, latency=0.002, bandwidth=20e6, points=10000, png_size=(800, 120), sleep=False):
+        """
+        :param latency: seconds added to every write, query and read
+        :param bandwidth: bytes per second for the data moved by a transaction
+        :param points: points per segment of the synthetic waveforms
+        :param png_size: (width, height) of the synthetic screen image
+        :param sleep: really sleep for the simulated time, otherwise it is only added to stats['time']
+        """
+        self.latency    = latency
+        self.bandwidth  = bandwidth
+        self.points     = points
+        self.png_size   = png_size
+        self.sleep      = sleep
+        self.timeout    = 5000
+        self.chunk_size = 20 * 1024
+        self.props      = {}
+        self.pending    = b''   # answer waiting for read_raw
+        self.wfsu       = {'SP': 0, 'NP': 0, 'FP': 0, 'SN': 0}
+        self.log        = []    # commands received, in order
+        self.png_data   = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'round_trips': 0, 'bytes_written': 0, 'bytes_read': 0, 'time': 0.0}
+
+    def transaction(self, written, read):
+        seconds = self.latency + (written + read) / self.bandwidth
+        self.stats['round_trips']   += 1
+        self.stats['bytes_written'] += written
+        self.stats['bytes_read']    += read
+        self.stats['time']          += seconds
+        if self.sleep:
+            time.sleep(seconds)
+
+    # --- pyvisa interface ---
+
+    def write(self, command):
+        self.transaction(len(command), 0)
+        self.execute(command)
+        return len(command)  # like pyvisa, the number of bytes written
+
+    def write_raw(self, message):
+        self.transaction(len(message), 0)
+        self.execute(message.decode('latin-1'))
+        return len(message)
+
+    def query(self, command):
+        answer = self.execute(command)
+        self.transaction(len(command), len(answer))
+        return answer
+
+    def read_raw(self, size=None):
+        answer, self.pending = self.pending, b''
+        self.transaction(0, len(answer))
+        return answer
+
+    def close(self):
+        pass
+
+    # --- command interpreter ---
+
+    def prop(self, path, default='0'):
+        return self.props.get(path.lower(), default)
+
+    def execute(self, command):
+        self.log.append(command)
+        if command.startswith('VBS?'):
+            return self.vbs_query(command[4:].strip().strip("'"))
+        if command.startswith('VBS '):
+            self.vbs_write(command[4:].strip().strip("'"))
+            return ''
+        if command.startswith('PNL #'):
+            digits = int(command[5])
+            self.props = json.loads(command[6 + digits:6 + digits + int(command[6:6 + digits])])
+            return ''
+        answer = ''
+        for part in command.split(';'):
+            answer += self.command(part.strip())
+        return answer
+
+    def vbs_write(self, script):
+        # statements are separated by ':' outside of quoted strings
+        for statement in re.findall(r'(?:[^:"]|"[^"]*")+', script):
+            match = re.match(r'^\s*(app(?:\.\w+)+)\s*=\s*(.+?)\s*$', statement)
+            if match:
+                self.props[match.group(1).lower()] = match.group(2).strip('"')
+
+    def vbs_query(self, script):
+        expression = re.sub(r'^return\s*=\s*', '', script)
+        values = [self.evaluate(term.strip()) for term in expression.split(' & Chr(30) & ')]
+        return '\x1e'.join(values) + '\n'
+
+    def evaluate(self, term):
+        if term.lower().startswith('app.waituntilidle'):
+            return '-1'
+        if term.lower() == 'app.acquisition.horizontal.numpoints':
+            return str(self.points)
+        match = re.match(r'app\.Measure\.(P\d+)\.(?:Out\.Result\.Value|Statistics\("(\w+)"\)\.Result\.(\w+))', term, re.I)
+        if match:
+            return self.measurement(match.group(1), match.group(2), match.group(3))
+        return self.prop(term)
+
+    def measurement(self, slot, stat, field):
+        if field and field.lower() == 'statusdescription':
+            return 'Averaged over 1 sweep'
+        source = self.prop('app.Measure.{0}.Source1'.format(slot), 'C1')
+        if not re.match(r'C\d$', source, re.I):
+            return 'No Data'
+        volts = self.volts(int(source[1:]))
+        if stat == 'num':
+            return '1'
+        if stat == 'sdev':
+            return '0'
+        param = self.prop('app.Measure.{0}.ParamEngine'.format(slot), 'max').lower()
+        value = {'max': volts.max(), 'min': volts.min(), 'pkpk': np.ptp(volts), 'mean': volts.mean(),
+                 'median': np.median(volts), 'level@x': volts[len(volts) // 2]}.get(param, volts.mean())
+        return repr(float(value))
+
+    def command(self, command):
+        header = command.split()[0].upper() if command else ''
+        if header == '*RST':
+            self.props.clear()
+        elif header == '*IDN?':
+            return 'LECROY,SIMULATED,0,0\n'
+        elif header in ('*OPC?', 'INR?'):
+            return '1\n'
+        elif header == 'TDIV':
+            self.props['app.acquisition.horizontal.horscale'] = command.split()[1]
+        elif header == 'WFSU':
+            fields = command.split(None, 1)[1].split(',')
+            self.wfsu.update({fields[i].upper(): int(fields[i + 1]) for i in range(0, len(fields) - 1, 2)})
+        elif header == 'PNL?':
+            self.pending = self.block(json.dumps(self.props).encode())
+        elif header == 'SCDP':
+            self.pending = self.png()
+        elif ':WF?' in header:
+            self.pending = self.waveform(header.split(':')[0], command.split()[1].upper() if ' ' in command else 'ALL')
+        return ''
+
+    # --- synthetic payloads ---
+
+    def block(self, data):
+        return b'#9%09d' % len(data) + data + b'\n'
+
+    def png(self):
+        if self.png_data is not None:
+            return self.png_data
+        width, height = self.png_size
+        rows = random.Random(0)
+        raw = b''.join(b'\x00' + bytes(rows.getrandbits(8) & 0x0F for _ in range(width)) for _ in range(height))
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+        self.png_data = (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+                         chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+        return self.png_data
+
+    def segments(self):
+        if self.prop('app.Acquisition.Horizontal.SampleMode', 'RealTime').lower() == 'sequence':
+            return int(float(self.prop('app.Acquisition.Horizontal.NumSegments', '10')))
+        return 1
+
+    def volts(self, channel, segments=1):
+        t = np.arange(self.points * segments) / self.points
+        return 0.5 * np.sin(2 * np.pi * 5 * t + channel) + 0.1 * channel
+
+    def digital(self, segments=1):
+        # lane n toggles every 8 * (n + 1) samples
+        index = np.arange(self.points * segments)
+        words = np.zeros(len(index), dtype='<u2')
+        for lane in range(16):
+            words |= (((index // (8 * (lane + 1))) % 2) << lane).astype('<u2')
+        return words.view('<i2')
+
+    def waveform(self, source, part):
+        channel = int(source[1:]) if source[1:].isdigit() else 1
+        segments = self.segments()
+        ver_scale = float(self.prop('app.Acquisition.{0}.VerScale'.format(source), '0.5') or 0.5)
+        ver_offset = float(self.prop('app.Acquisition.{0}.VerOffset'.format(source), '0') or 0)
+        gain = ver_scale * 10 / 65536
+        if source.upper().startswith('DIGITAL'):
+            codes = self.digital(segments)
+        else:
+            codes = np.clip(np.round((self.volts(channel, segments) + ver_offset) / gain), -32768, 32512).astype('<i2')
+        sparsing = max(self.wfsu['SP'], 1)
+        codes = np.ascontiguousarray(codes.reshape(segments, -1)[:, ::sparsing]).reshape(-1)
+        trigtimes = np.zeros((segments, 2), '<f8') if segments > 1 else np.zeros((0, 2), '<f8')
+        trigtimes[:, 0] = np.arange(len(trigtimes)) * 1e-3
+        hor_scale = float(self.prop('app.Acquisition.Horizontal.HorScale', '1e-3'))
+        desc = bytearray(346)
+        desc[0:8] = b'WAVEDESC'
+        desc[16:26] = b'LECROY_2_3'
+        struct.pack_into('<hhi', desc, 32, 1, 1, 346)
+        struct.pack_into('<i', desc, 48, trigtimes.nbytes)
+        struct.pack_into('<i', desc, 60, codes.nbytes)
+        desc[76:86] = b'SIMULATED\x00'
+        struct.pack_into('<i', desc, 116, codes.size)
+        struct.pack_into('<i', desc, 144, segments)
+        struct.pack_into('<ffff', desc, 156, gain, ver_offset, 32512, -32768)
+        struct.pack_into('<h', desc, 172, 8)
+        struct.pack_into('<fd', desc, 176, hor_scale * 10 / self.points * sparsing, -hor_scale * 5)
+        struct.pack_into('<h', desc, 344, channel - 1)
+        if part == 'DESC':
+            return self.block(bytes(desc))
+        if part == 'TIME':
+            return self.block(trigtimes.tobytes())
+        if part == 'DAT1':
+            first = self.wfsu['FP']
+            count = self.wfsu['NP'] or codes.size
+            return self.block(codes[first:first + count].tobytes())
+        return self.block(bytes(desc) + trigtimes.tobytes() + codes.tobytes())
@@ -1,6 +1,5 @@
 #!/usr/bin/python
 
-import time
 import pyvisa
 from   lecroy import lecroy
 
@@ -42,7 +41,7 @@ measurement_channels = { 1:  ('C1', 'max'),
                          12: ('C8', 'level@x') }
 						 
 lecroy.reset_scope()
-time.sleep(2)
+lecroy.wait_for_idle()
 lecroy.set_date_and_time() # use system date and time
 lecroy.setGrid('Single')
 lecroy.channel_setup(analog_channels, digital_channels)
@@ -56,10 +55,13 @@ lecroy.measurement_levelatx(meas_channel=11, position=-1.0e-6)     #before trigg
 lecroy.measurement_levelatx(meas_channel=12, position=1.599992e-3) #last captured value
 lecroy.get_measurement_setup()
 lecroy.trigger_setup(channel='C4', trig_level=0.25, trig_horizontal=hor_scale * (-3), trig_slope='Positive', trig_mode='Auto')
-time.sleep(2)
+lecroy.query('INR?') # clear the new acquisition flag of the acquisitions before the new settings
+lecroy.wait_for_trigger(timeout=2)
 lecroy.update_signal_offset(analog_channels, 'LITTLE_I1', 0) #adjust the offset for 'LITTLE_I1' signal to be on the center division
 lecroy.trigger_setup(channel='C4', trig_level=0.25, trig_horizontal=hor_scale * (-3), trig_slope='Positive', trig_mode='Single')
 lecroy.get_trigger_setup()
+lecroy.arm_single()
+lecroy.wait_for_trigger(timeout=10)
 lecroy.get_screen_image('super_awesome_waveform_12')
 
 max_C1                  = "{:.3f}".format(lecroy.getValueOnChannel('P1', 'value'))